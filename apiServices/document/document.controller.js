@@ -9,6 +9,7 @@ import CustomError from '../../utils/customError.js'
 import config from 'config'
 import { Logger } from '../../utils/logger.js'
 import { sendEmail } from '../../services/email.service.js'
+import { runIngestionJob } from '../../services/ingestionWorker.service.js'
 
 // const execAsync = promisify(exec)
 const filePath = fileURLToPath(import.meta.url)
@@ -45,10 +46,6 @@ export const uploadDocument = async (req, res) => {
         }
         fs.writeFileSync(localPath, file.buffer)
 
-        const venvPython = config.get('venvPython')
-        const pythonPath = resolve(dirPath, `../../ciudadano_digital/${venvPython}`)
-        const servicePath = resolve(dirPath, '../../services/processDocumentService/main.py')
-
         // const commandArgs = [servicePath, localPath, docname, author, year, fileName, categories.join(','), minAge, maxAge]
 
         // const python = spawn(pythonPath, commandArgs, {
@@ -69,73 +66,57 @@ export const uploadDocument = async (req, res) => {
           maxAge,
         }
 
-        const py = spawn(pythonPath, [servicePath])
-        py.stdin.write(JSON.stringify(payload))
-        py.stdin.end()
-
-        let output = ''
-        let errorOutput = ''
-        py.stdout.on('data', (data) => {
-          output += data.toString()
-        })
-
-        py.stderr.on('data', (data) => {
-          errorOutput += data.toString()
-          logger.error(data.toString(), { title: 'Python stderr' })
-        })
-
-        py.on('error', (error) => {
-          logger.error(error.message, { title: 'Spawn error' })
-        })
-
-        py.on('close', async (code) => {
+        // El documento se encola en el proceso residente de indexación en lugar de iniciar un Python por archivo
+        let responseData
+        try {
+          responseData = await runIngestionJob(payload)
+        } catch (error) {
+          logger.error(error.message, { title: 'Error al ejecutar python' })
+          await sendEmail({
+            to: email,
+            subject: 'Error al procesar documento',
+            html: `<p>El documento <b>${docname}</b> no pudo procesarse ni subirse al servidor correctamente.</p>`,
+          })
+          return
+        } finally {
           // Limpiar archivo temporal
           try {
             fs.unlinkSync(localPath)
           } catch (e) {
             logger.error('Error al eliminar archivo temporal', e)
           }
-          if (code !== 0) {
-            logger.error(`Python terminó con error: ${code}`, { title: 'Error al ejecutar python', stderr: errorOutput })
+        }
+
+        try {
+          const { success, category } = responseData
+
+          if (success) {
+            const categoryId = await getCategoryByDescription(category)
+
+            await saveDocumentModel({
+              userId: sub,
+              category: categoryId,
+              documentUrl: fileName,
+              title: docname,
+              author,
+              year: isNaN(parseInt(year, 10)) ? null : parseInt(year, 10),
+            })
+            await sendEmail({
+              to: email,
+              subject: 'Tu documento fue procesado correctamente',
+              html: `<p>El documento <b>${docname}</b> fue indexado exitosamente en el sistema.</p>`,
+            })
+          } else {
+            logger.error(`El procesamiento de Python indicó un fallo: ${JSON.stringify(responseData)}`, { title: 'Fallo en procesamiento Python' })
             await sendEmail({
               to: email,
               subject: 'Error al procesar documento',
               html: `<p>El documento <b>${docname}</b> no pudo procesarse ni subirse al servidor correctamente.</p>`,
             })
-            return
           }
-          try {
-            const responseData = JSON.parse(output)
-            const { success, category } = responseData
-
-            if (success) {
-              const categoryId = await getCategoryByDescription(category)
-
-              await saveDocumentModel({
-                userId: sub,
-                category: categoryId,
-                documentUrl: fileName,
-                title: docname,
-                author,
-                year: isNaN(parseInt(year, 10)) ? null : parseInt(year, 10),
-              })
-              await sendEmail({
-                to: email,
-                subject: 'Tu documento fue procesado correctamente',
-                html: `<p>El documento <b>${docname}</b> fue indexado exitosamente en el sistema.</p>`,
-              })
-            } else {
-              logger.error(`El procesamiento de Python indicó un fallo: ${responseData}`, { title: 'Fallo en procesamiento Python' })
-              await sendEmail({
-                to: email,
-                subject: 'Error al procesar documento',
-                html: `<p>El documento <b>${docname}</b> no pudo procesarse ni subirse al servidor correctamente.</p>`,
-              })
-            }
-          } catch (error) {
-            logger.error(error.message, { title: 'Error post-procesamiento Python' })
-          }
-        })
+        } catch (error) {
+          logger.error(error.message, { title: 'Error post-procesamiento Python' })
+        }
       } catch (error) {
         logger.error(error.message, { title: 'Error en procesamiento en segundo plano' })
       }
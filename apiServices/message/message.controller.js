@@ -1,19 +1,47 @@
-import { createMessageModel, getChatHistory, getChatMessagesModel, getChatSummary, insertNewSummary, updateMessageModel } from './message.model.js'
+import config from 'config'
+import { createMessageModel, getChatHistory, getChatMessagesModel, getChatSummary, getUnsummarizedMessages, insertNewSummary, updateMessageModel } from './message.model.js'
 import { createChatModel, getChatById } from '../chat/chat.model.js'
 import { Logger } from '../../utils/logger.js'
 import CustomError from '../../utils/customError.js'
-import config from 'config'
-import { spawn } from 'child_process'
-import { dirname, resolve } from 'path'
-import { fileURLToPath } from 'url'
 import { getCategories, getCategoryByDescription } from '../document/document.model.js'
 import { getUserById } from '../user/user.model.js'
-
-const filePath = fileURLToPath(import.meta.url)
-const dirPath = dirname(filePath)
+import { askQuestion, summarizeChat } from '../../services/questions.service.js'
 
 const logger = new Logger({ filename: 'message-controller.log' })
 
+// Mensajes nuevos que se acumulan antes de actualizar el resumen del chat. Debe ser menor que el historial
+// que se envía con cada pregunta (5 mensajes) para que ningún mensaje quede fuera de ambos
+const summaryEvery = Number(config.has('summaryEvery') && config.get('summaryEvery')) || 4
+const summarizingChats = new Set()
+
+/**
+ * Incorpora al resumen del chat los mensajes posteriores al último resumido, cada summaryEvery mensajes.
+ * Se ejecuta después de entregar la respuesta, fuera del tiempo de espera del usuario.
+ */
+const refreshSummary = async ({ userId, chatId }) => {
+  if (summarizingChats.has(chatId)) return
+  summarizingChats.add(chatId)
+  try {
+    const pending = await getUnsummarizedMessages({ chatId })
+    if (pending.length < summaryEvery) return
+
+    const resumen = await getChatSummary({ chatId })
+    const content = await summarizeChat({ resumen, mensajes: pending.map((m) => m.message) })
+    if (!content) return
+
+    await insertNewSummary({
+      userId,
+      chatId,
+      content,
+      lastMessageId: pending[pending.length - 1].messageid,
+    })
+  } catch (err) {
+    logger.error(err.message || err, { title: 'Error al actualizar el resumen del chat' })
+  } finally {
+    summarizingChats.delete(chatId)
+  }
+}
+
 export const createMessage = async (req, res) => {
   try {
     const { content } = req.body
@@ -94,7 +122,11 @@ export const assignMessage = async (req, res) => {
   }
 }
 
+const sendEvent = (res, event, data) => res.write(`event: ${event}\ndata: ${JSON.stringify(data)}\n\n`)
+
 export const getResponse = async (req, res) => {
+  // Con ?stream=true la respuesta se envía como Server-Sent Events: "delta" con cada fragmento y "done" al final
+  const stream = req.query.stream === 'true'
   try {
     const { sub } = req.user
     const { question } = req.query
@@ -120,10 +152,6 @@ export const getResponse = async (req, res) => {
       }
     }
 
-    const venvPython = config.get('venvPython')
-    const pythonPath = resolve(dirPath, `../../ciudadano_digital/${venvPython}`)
-    const servicePath = resolve(dirPath, '../../services/questionsService/main.py')
-
     const chat = !chatId ? undefined : await getChatById({ chatId })
     const historial = !chatId ? [] : await getChatHistory({ chatId })
     const resumen = !chatId ? '' : await getChatSummary({ chatId })
@@ -137,71 +165,68 @@ export const getResponse = async (req, res) => {
       edad: Number(edad) || 0,
     }
 
-    const py = spawn(pythonPath, [servicePath])
-
-    py.stdin.write(JSON.stringify(payload))
-    py.stdin.end()
-
-    let stdout = ''
-    let stderr = ''
-
     const startTime = Date.now()
 
-    py.stdout.on('data', (data) => (stdout += data))
-    py.stderr.on('data', (data) => (stderr += data))
-
-    py.on('close', async (code) => {
-      if (stderr || code !== 0) {
-        logger.error(stderr, { title: 'Error al ejecutar Python' })
-        return res.status(500).json({ error: 'No se pudo obtener la respuesta' })
-      }
-
-      let responseData
-      try {
-        responseData = JSON.parse(stdout)
-      } catch (e) {
-        logger.error(`${stdout} || ${e.message}`, { title: 'Respuesta inválida de Python' })
-        return res.status(500).json({ error: 'Respuesta inválida del servicio Python' })
-      }
-
-      const elapsedMs = Date.now() - startTime
-      const { response, reference, _, category, chatName, resumen: nuevoResumen } = responseData
+    if (stream) {
+      res.status(200).set({ 'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache', Connection: 'keep-alive' })
+      res.flushHeaders()
+    }
 
-      let newChat = null
-      if (!chatId) {
-        newChat = await createChatModel({
-          userId: sub,
-          name: chatName,
-        })
+    let responseData
+    try {
+      responseData = await askQuestion(payload, stream ? { onDelta: (text) => sendEvent(res, 'delta', { text }) } : {})
+    } catch (e) {
+      logger.error(e.message, { title: 'Error al ejecutar Python' })
+      if (stream) {
+        sendEvent(res, 'error', { error: 'No se pudo obtener la respuesta' })
+        return res.end()
       }
+      return res.status(500).json({ error: 'No se pudo obtener la respuesta' })
+    }
 
-      await getCategoryByDescription(category)
+    const elapsedMs = Date.now() - startTime
+    const { response, reference, category, chatName } = responseData
 
-      const message = await createMessageModel({
-        content: response,
-        source: 'assistant',
-        reference,
-        chatId: newChat?.chatid ?? chatId,
-        responseTime: elapsedMs,
+    let newChat = null
+    if (!chatId) {
+      newChat = await createChatModel({
+        userId: sub,
+        name: chatName,
       })
+    }
 
-      if (nuevoResumen) {
-        await insertNewSummary({
-          userId: sub,
-          chatId: newChat?.chatid ?? chatId,
-          content: nuevoResumen,
-        })
-      }
+    await getCategoryByDescription(category)
 
-      return res.status(201).json({
-        message: 'Respuesta obtenida.',
-        newChat: newChat !== null,
-        chatMessage: message,
-      })
+    const message = await createMessageModel({
+      content: response,
+      source: 'assistant',
+      reference,
+      chatId: newChat?.chatid ?? chatId,
+      responseTime: elapsedMs,
     })
+
+    const result = {
+      message: 'Respuesta obtenida.',
+      newChat: newChat !== null,
+      chatMessage: message,
+    }
+    if (stream) {
+      sendEvent(res, 'done', result)
+      res.end()
+    } else {
+      res.status(201).json(result)
+    }
+
+    // El resumen se actualiza en segundo plano, con la respuesta ya entregada
+    refreshSummary({ userId: sub, chatId: newChat?.chatid ?? chatId })
   } catch (err) {
     logger.error(err.message || err, { title: 'Error en getResponse' })
 
+    if (res.headersSent) {
+      sendEvent(res, 'error', { error: err instanceof CustomError ? err.message : 'Error interno del servidor' })
+      return res.end()
+    }
+
     if (err instanceof CustomError) {
       return res.status(err.status).json({ error: err.message })
     }
@@ -143,18 +143,36 @@ export const getChatSummary = async ({ chatId }) => {
   return rows[0].content
 }
 
-export const insertNewSummary = async ({ userId, chatId, content }) => {
+export const getUnsummarizedMessages = async ({ chatId, limit = 50 }) => {
   const pool = await getConnection()
 
+  // Mensajes posteriores al último incorporado al resumen (los más recientes, devueltos en orden cronológico)
   const query = `
-    INSERT INTO ResumenChat (userid, chatid, content)
-      VALUES ($1, $2, $3)
+    SELECT m.messageId, m.source||'-'||m.content as message
+      FROM Mensaje m
+      LEFT JOIN ResumenChat r ON r.chatId = m.chatId
+    WHERE m.chatid = $1
+      AND m.messageId > COALESCE(r.lastMessageId, 0)
+    ORDER BY m.messageId DESC
+    LIMIT $2;`
+
+  const { rows } = await pool.query(query, [chatId, limit])
+
+  return rows.reverse()
+}
+
+export const insertNewSummary = async ({ userId, chatId, content, lastMessageId }) => {
+  const pool = await getConnection()
+
+  const query = `
+    INSERT INTO ResumenChat (userid, chatid, content, lastMessageId)
+      VALUES ($1, $2, $3, $4)
     ON CONFLICT (userId, chatId)
-      DO UPDATE SET content = EXCLUDED.content
-    RETURNING userid, chatid, content;
+      DO UPDATE SET content = EXCLUDED.content, lastMessageId = EXCLUDED.lastMessageId
+    RETURNING userid, chatid, content, lastMessageId;
   `
 
-  const values = [userId, chatId, content]
+  const values = [userId, chatId, content, lastMessageId]
 
   const { rows } = await pool.query(query, values)
 
@@ -19,4 +19,6 @@ module.exports = {
   smtpUser: process.env.SMTP_USER,
   smtpPass: process.env.SMTP_APP_PASS,
   venvPython: process.env.VENV_PYTHON,
+  questionsSocket: process.env.QUESTIONS_SOCKET,
+  summaryEvery: process.env.SUMMARY_EVERY,
 }
@@ -118,3 +118,6 @@ CREATE TABLE ResumenChat (
         REFERENCES Chat(chatId)
         ON DELETE CASCADE
 );
+
+-- Último mensaje incorporado al resumen: solo se resumen los mensajes posteriores
+ALTER TABLE ResumenChat ADD COLUMN IF NOT EXISTS lastMessageId INT;
@@ -0,0 +1,243 @@
+"""Corpus sintético de documentos y carga de preguntas reproducible para los benchmarks sin red.
+
+Genera documentos en español sobre las categorías de CATEGORIES con el vocabulario de cada una, en los
+formatos que procesa processDocumentService: PDF con texto, PDF escaneado (páginas como imagen, requieren
+OCR), DOCX y PPTX. Junto a los documentos escribe manifest.json (payloads de indexación, mismo formato que
+main_batch.py) y questions.jsonl (payloads de questionsService derivados del texto de los documentos,
+con chats nuevos, seguimientos con historial y resumen, y preguntas repetidas).
+
+Uso:
+    python services/benchmarks/corpus.py DIRECTORIO [--documents 24] [--questions 200] [--pages 4] [--seed 7]
+        [--kinds text-pdf,scanned-pdf,docx,pptx]
+"""
+import argparse
+import json
+import os
+import random
+
+# Vocabulario por categoría: temas, acciones y complementos con los que se arman las oraciones
+CATEGORIES = {
+    "Derechos humanos": {
+        "subjects": ["la dignidad humana", "la libertad de expresión", "el derecho a la educación", "la igualdad ante la ley", "la no discriminación", "el derecho a la salud"],
+        "verbs": ["protege", "garantiza", "reconoce", "defiende", "promueve"],
+        "objects": ["a cada persona", "a la niñez y la adolescencia", "a los pueblos indígenas", "a las personas con discapacidad", "a quienes migran"],
+        "complements": ["según la Constitución", "en los tratados internacionales", "frente a cualquier abuso de poder", "sin importar su origen", "en todo el territorio"],
+    },
+    "Participación ciudadana": {
+        "subjects": ["el voto", "el consejo comunitario", "la consulta popular", "la asamblea estudiantil", "la rendición de cuentas", "el presupuesto participativo"],
+        "verbs": ["fortalece", "organiza", "permite", "fiscaliza", "impulsa"],
+        "objects": ["las decisiones del municipio", "la gestión pública", "los proyectos del barrio", "la elección de autoridades", "el uso de los fondos públicos"],
+        "complements": ["con la participación de los vecinos", "cada cuatro años", "mediante mecanismos transparentes", "desde la escuela", "en las comunidades rurales"],
+    },
+    "Ciudadanía digital": {
+        "subjects": ["la contraseña segura", "la huella digital", "la verificación de noticias", "la privacidad en redes sociales", "el ciberacoso", "la autenticación en dos pasos"],
+        "verbs": ["protege", "expone", "previene", "afecta", "requiere"],
+        "objects": ["los datos personales", "la identidad en internet", "las cuentas de correo", "la reputación en línea", "la información compartida"],
+        "complements": ["al navegar en internet", "en los teléfonos móviles", "frente al robo de identidad", "en las plataformas educativas", "al publicar fotografías"],
+    },
+    "Medio ambiente": {
+        "subjects": ["el reciclaje", "la reforestación", "el cambio climático", "el ahorro de agua", "la contaminación del aire", "la energía solar"],
+        "verbs": ["reduce", "amenaza", "conserva", "mejora", "transforma"],
+        "objects": ["los ríos y lagos", "la biodiversidad", "los bosques nublados", "la calidad de vida", "los recursos naturales"],
+        "complements": ["en las ciudades", "para las próximas generaciones", "con acciones cotidianas", "en la época de lluvias", "según los estudios recientes"],
+    },
+}
+
+AUTHORS = ["Ministerio de Educación", "Procuraduría de los Derechos Humanos", "Tribunal Supremo Electoral", "Instituto Nacional de Bosques"]
+# Rangos de edad de los documentos (cada pregunta usa una edad dentro del rango de su documento)
+AGE_RANGES = [(10, 13), (12, 16), (14, 18), (10, 18)]
+KINDS = ["text-pdf", "scanned-pdf", "docx", "pptx"]
+EXTENSIONS = {"text-pdf": ".pdf", "scanned-pdf": ".pdf", "docx": ".docx", "pptx": ".pptx"}
+
+# Proporción de preguntas de seguimiento (con historial y resumen) y de preguntas repetidas
+FOLLOW_UP_RATE = 0.3
+REPEAT_RATE = 0.1
+
+
+def sentence(rng: random.Random, category: str) -> str:
+    words = CATEGORIES[category]
+    text = f"{rng.choice(words['subjects'])} {rng.choice(words['verbs'])} {rng.choice(words['objects'])} {rng.choice(words['complements'])}."
+    return text[0].upper() + text[1:]
+
+
+def document_pages(rng: random.Random, category: str, pages: int) -> list:
+    """Páginas del documento: [(título, [párrafos])], con algunas oraciones de otras categorías."""
+    others = [name for name in CATEGORIES if name != category]
+    result = []
+    for number in range(pages):
+        paragraphs = []
+        for _ in range(rng.randint(3, 5)):
+            sentences = [sentence(rng, category if rng.random() < 0.85 else rng.choice(others)) for _ in range(rng.randint(4, 7))]
+            paragraphs.append(" ".join(sentences))
+        result.append((f"{category}: sección {number + 1}", paragraphs))
+    return result
+
+
+def page_text(title: str, paragraphs: list) -> str:
+    return title + "\n\n" + "\n\n".join(paragraphs)
+
+
+def write_text_pdf(path: str, pages: list):
+    import fitz
+
+    doc = fitz.open()
+    for title, paragraphs in pages:
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), page_text(title, paragraphs), fontsize=10)
+    doc.save(path)
+
+
+def write_scanned_pdf(path: str, pages: list):
+    """PDF sin capa de texto: cada página es la imagen de una página con texto (como un documento escaneado)."""
+    import fitz
+
+    source = fitz.open()
+    for title, paragraphs in pages:
+        page = source.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), page_text(title, paragraphs), fontsize=11)
+    doc = fitz.open()
+    for page in source:
+        pixmap = page.get_pixmap(dpi=150, colorspace=fitz.csGRAY)
+        doc.new_page(width=page.rect.width, height=page.rect.height).insert_image(page.rect, pixmap=pixmap)
+    doc.save(path)
+
+
+def write_docx(path: str, pages: list):
+    import docx
+
+    doc = docx.Document()
+    for title, paragraphs in pages:
+        doc.add_heading(title, level=1)
+        for paragraph in paragraphs:
+            doc.add_paragraph(paragraph)
+    doc.save(path)
+
+
+def write_pptx(path: str, pages: list):
+    from pptx import Presentation
+
+    prs = Presentation()
+    for title, paragraphs in pages:
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        slide.shapes.title.text = title
+        slide.placeholders[1].text = "\n".join(paragraphs)
+    prs.save(path)
+
+
+WRITERS = {"text-pdf": write_text_pdf, "scanned-pdf": write_scanned_pdf, "docx": write_docx, "pptx": write_pptx}
+
+
+def generate_documents(directory: str, documents: int, pages: int, kinds: list, seed: int) -> list:
+    """Escribe los documentos en directory; devuelve sus payloads de indexación con el texto generado ("sentences")."""
+    rng = random.Random(seed)
+    categories = list(CATEGORIES)
+    jobs = []
+    for number in range(documents):
+        kind = kinds[number % len(kinds)]
+        # Cada formato recorre todas las categorías
+        category = categories[(number + number // len(kinds)) % len(categories)]
+        min_age, max_age = AGE_RANGES[number % len(AGE_RANGES)]
+        content = document_pages(rng, category, pages)
+        name = f"{number + 1:03d}-{kind}{EXTENSIONS[kind]}"
+        WRITERS[kind](os.path.join(directory, name), content)
+        jobs.append({
+            "filePath": name,
+            "fileName": f"{category} {number + 1}",
+            "author": AUTHORS[number % len(AUTHORS)],
+            "year": 2015 + number % 10,
+            "remotePath": f"benchmark/{name}",
+            "categories": categories,
+            "minAge": min_age,
+            "maxAge": max_age,
+            "kind": kind,
+            "sentences": [text.strip() + "." for _, paragraphs in content for paragraph in paragraphs for text in paragraph.split(".") if text.strip()],
+        })
+    return jobs
+
+
+def question_from(sentence_text: str, rng: random.Random) -> str:
+    text = sentence_text.rstrip(".")
+    text = text[0].lower() + text[1:]
+    return rng.choice(["¿Por qué {}?", "¿Es cierto que {}?", "¿Qué significa que {}?", "Explícame cómo {}"]).format(text)
+
+
+def generate_workload(jobs: list, questions: int, seed: int) -> list:
+    """Payloads de questionsService (con "stream" y "metrics") derivados de las oraciones de los documentos."""
+    rng = random.Random(seed)
+    categories = list(CATEGORIES)
+    workload = []
+    for number in range(questions):
+        if workload and rng.random() < REPEAT_RATE:
+            # Preguntas repetidas (sin historial), como las que comparten muchos estudiantes
+            repeated = [item for item in workload if not item["historial"]]
+            if repeated:
+                workload.append(dict(rng.choice(repeated)))
+                continue
+        job = rng.choice(jobs)
+        payload = {
+            "question": question_from(rng.choice(job["sentences"]), rng),
+            "categories": categories,
+            "historial": [],
+            "resumen": None,
+            "chat": "undefined",
+            "edad": rng.randint(job["minAge"], job["maxAge"]),
+            "stream": True,
+            "metrics": True,
+        }
+        if rng.random() < FOLLOW_UP_RATE:
+            # El historial llega del mensaje más reciente al más antiguo
+            previous = question_from(rng.choice(job["sentences"]), rng)
+            payload["historial"] = [f"assistant-{' '.join(rng.sample(job['sentences'], 3))}", f"user-{previous}"]
+            payload["resumen"] = f"El estudiante pregunta sobre {job['fileName'].rsplit(' ', 1)[0].lower()}: {previous}"
+            payload["chat"] = f"Chat {number + 1}"
+        workload.append(payload)
+    return workload
+
+
+def generate(directory: str, documents: int = 24, questions: int = 200, pages: int = 4, kinds: list = KINDS, seed: int = 7) -> tuple:
+    """Genera el corpus y la carga en directory (manifest.json y questions.jsonl); devuelve (jobs, workload)."""
+    os.makedirs(directory, exist_ok=True)
+    jobs = generate_documents(directory, documents, pages, kinds, seed)
+    workload = generate_workload(jobs, questions, seed)
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump([{key: value for key, value in job.items() if key != "sentences"} for job in jobs], f, ensure_ascii=False, indent=2)
+    save_workload(os.path.join(directory, "questions.jsonl"), workload)
+    return load_manifest(directory), workload
+
+
+def load_manifest(directory: str) -> list:
+    """Payloads de indexación de un corpus generado, con rutas absolutas."""
+    with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+        jobs = json.load(f)
+    for job in jobs:
+        job["filePath"] = os.path.join(os.path.abspath(directory), job["filePath"])
+    return jobs
+
+
+def save_workload(path: str, workload: list):
+    with open(path, "w", encoding="utf-8") as f:
+        for payload in workload:
+            f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+
+
+def load_workload(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Corpus sintético y carga de preguntas para los benchmarks.")
+    parser.add_argument("directory")
+    parser.add_argument("--documents", type=int, default=24)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=4, help="Páginas (o diapositivas) por documento.")
+    parser.add_argument("--kinds", default=",".join(KINDS), help="Formatos, separados por comas: " + ", ".join(KINDS))
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    jobs, workload = generate(args.directory, args.documents, args.questions, args.pages, args.kinds.split(","), args.seed)
+    print(f"{len(jobs)} documentos y {len(workload)} preguntas en {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
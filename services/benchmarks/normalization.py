@@ -0,0 +1,144 @@
+"""Corpus dorado de la normalización y segmentación por unidades de processDocumentService.
+
+Cada caso de golden/normalization.json tiene las unidades de un documento (páginas, párrafos, diapositivas o
+líneas, como las entrega iter_text_from_file) y los fragmentos esperados de segment_stream(normalize_stream()).
+El script verifica que el pipeline por unidades produzca exactamente esos fragmentos y que coincida con el
+pipeline original sobre el documento completo (clean_text → standardize_format → validate_integrity →
+segment_text), salvo la diferencia intencional:
+
+    La regla de integridad (más del 60% de caracteres alfanuméricos o espacios) se evalúa por unidad. En el
+    pipeline original la limpieza deja el documento en una sola línea, así que la regla se evaluaba sobre el
+    documento completo: una página corrupta (p. ej. OCR de una tabla o un gráfico) se conservaba si el resto
+    del documento era bueno, y un documento con suficientes páginas corruptas se descartaba entero. Ahora se
+    descartan solo las unidades corruptas. Por eso el pipeline por unidades se compara con el original
+    aplicado a las unidades que pasan la regla (legacy_fragments(..., per_unit_integrity=True)); los casos con
+    "matchesLegacy": false muestran la diferencia respecto al original sin ese filtro.
+
+Con --random N se comparan además N documentos aleatorios (ASCII, con tildes, títulos, numeraciones, páginas
+corruptas y números de página) contra el pipeline original con integridad por unidad; el proceso termina con
+código 1 ante cualquier diferencia.
+
+Uso:
+    python services/benchmarks/normalization.py [--random 500] [--seed 7] [--update]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+import corpus
+
+SERVICES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), "golden", "normalization.json")
+
+sys.path.insert(0, os.path.join(SERVICES_DIR, "processDocumentService"))
+from utils import clean_text, normalize_stream, normalize_unit, segment_stream, segment_text, standardize_format, validate_integrity
+
+# Unidades corruptas, títulos y números de página para los documentos aleatorios
+NOISE = ["@@##$$%%^^&&**", "|||| ---- |||| ____", "~~~ ### ~~~ ***", "∑∂√∫ ≈≠≤≥ ∞", "....... ,,,,,,, ;;;;;;"]
+PAGE_NUMBERS = ["1", "12", "- 3 -", "Página 4", "iv"]
+
+
+def stream_fragments(units: list) -> list:
+    return list(segment_stream(normalize_stream(units)))
+
+
+def legacy_fragments(units: list, per_unit_integrity: bool = False) -> list:
+    """Pipeline original sobre el documento completo; con per_unit_integrity, solo con las unidades que pasan la regla."""
+    if per_unit_integrity:
+        units = [unit for unit in units if normalize_unit(unit)]
+    text = "\n".join(units).strip()
+    return segment_text(validate_integrity(standardize_format(clean_text(text))))
+
+
+def random_units(rng: random.Random) -> list:
+    """Unidades de un documento aleatorio con el vocabulario de corpus.py y algunas unidades problemáticas."""
+    category = rng.choice(list(corpus.CATEGORIES))
+    units = []
+    if rng.random() < 0.5:
+        title = f"{category}: sección {rng.randint(1, 9)}"
+        units.append(rng.choice([f"# {title}", f"{rng.randint(1, 9)}) {title}", f"{rng.randint(1, 9)}.- {title}", title.upper()]))
+    for _ in range(rng.randint(1, 12)):
+        roll = rng.random()
+        if roll < 0.1:
+            units.append(rng.choice(NOISE) * rng.randint(1, 4))
+        elif roll < 0.2:
+            units.append(rng.choice(PAGE_NUMBERS))
+        elif roll < 0.25:
+            units.append(rng.choice(units) if units else "")
+        else:
+            sentences = [corpus.sentence(rng, category) for _ in range(rng.randint(1, 30))]
+            if rng.random() < 0.3:
+                sentences = [text.encode("ascii", "ignore").decode() for text in sentences]
+            units.append(("\n" if rng.random() < 0.3 else " ").join(sentences))
+    return units
+
+
+def check_golden(cases: list) -> list:
+    """Diferencias entre los fragmentos del pipeline por unidades y los del corpus dorado."""
+    problems = []
+    for case in cases:
+        fragments = stream_fragments(case["units"])
+        if fragments != case["fragments"]:
+            problems.append(f"{case['name']}: los fragmentos no coinciden con el corpus dorado")
+        if fragments != legacy_fragments(case["units"], per_unit_integrity=True):
+            problems.append(f"{case['name']}: difiere del pipeline original con integridad por unidad")
+        if (fragments == legacy_fragments(case["units"])) != case["matchesLegacy"]:
+            problems.append(f"{case['name']}: matchesLegacy ya no describe la diferencia con el pipeline original")
+    return problems
+
+
+def check_random(documents: int, seed: int) -> tuple:
+    """Compara documentos aleatorios; devuelve (diferencias, documentos que difieren del original sin el filtro)."""
+    rng = random.Random(seed)
+    problems = []
+    per_unit = 0
+    for number in range(documents):
+        units = random_units(rng)
+        fragments = stream_fragments(units)
+        if fragments != legacy_fragments(units, per_unit_integrity=True):
+            problems.append(f"aleatorio {number} (seed {seed}): {json.dumps(units, ensure_ascii=False)[:300]}")
+        elif fragments != legacy_fragments(units):
+            per_unit += 1
+    return problems, per_unit
+
+
+def load_cases() -> list:
+    with open(GOLDEN_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica la normalización por unidades contra el corpus dorado.")
+    parser.add_argument("--random", type=int, default=500, help="Documentos aleatorios a comparar (0 = solo el corpus dorado).")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--update", action="store_true", help="Regenera los fragmentos esperados con la implementación actual.")
+    args = parser.parse_args()
+
+    cases = load_cases()
+    if args.update:
+        for case in cases:
+            case["fragments"] = stream_fragments(case["units"])
+            case["matchesLegacy"] = case["fragments"] == legacy_fragments(case["units"])
+        with open(GOLDEN_PATH, "w", encoding="utf-8") as f:
+            json.dump(cases, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"Corpus dorado actualizado: {GOLDEN_PATH}")
+
+    problems = check_golden(cases)
+    print(f"Corpus dorado: {len(cases)} casos, {sum(not case['matchesLegacy'] for case in cases)} con la diferencia intencional")
+    if args.random:
+        random_problems, per_unit = check_random(args.random, args.seed)
+        problems += random_problems
+        print(f"Aleatorios: {args.random} documentos, {per_unit} difieren del original solo por la integridad por unidad")
+
+    for problem in problems:
+        print(f"Diferencia: {problem}")
+    if not problems:
+        print("Sin diferencias.")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""Benchmark sin red de processDocumentService y questionsService.
+
+Levanta los servidores de stand_ins.py en lugar de OpenAI y Pinecone (con la latencia, límites y errores del
+escenario), genera el corpus sintético y la carga de preguntas de corpus.py (o reutiliza los de --corpus),
+indexa el corpus con processDocumentService/worker.py y responde las preguntas con questionsService/server.py
+(con streaming, manteniendo --concurrency preguntas en curso). Reporta documentos y fragmentos por segundo,
+latencia p50/p95/p99 de las preguntas y del primer fragmento de la respuesta, y el tiempo por etapa.
+Los resultados se comparan con baselines/offline.json; el proceso termina con código 1 si hay regresión.
+La línea base depende de la máquina y no se incluye en el repositorio: la primera ejecución en cada máquina
+debe usar --update-baseline; mientras el escenario no tenga línea base el proceso termina con código 2.
+
+Uso:
+    python services/benchmarks/offline.py [--scenario default] [--documents 24] [--questions 200] [--concurrency 8]
+        [--corpus DIRECTORIO] [--workload preguntas.jsonl] [--tolerance 1.5] [--update-baseline] [--output resultados.json]
+"""
+import argparse
+import json
+import math
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import corpus
+from stand_ins import stand_in_env, start_stand_ins
+
+SERVICES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "offline.json")
+WORKER = os.path.join(SERVICES_DIR, "processDocumentService", "worker.py")
+QUESTIONS_SERVER = os.path.join(SERVICES_DIR, "questionsService", "server.py")
+
+# Parámetros de Faults de cada servidor simulado
+SCENARIOS = {
+    # Latencias habituales de las APIs, sin límites ni errores
+    "default": {
+        "openai": {"latency": 0.08, "jitter": 0.04, "token_latency": 0.005},
+        "pinecone": {"latency": 0.02, "jitter": 0.01},
+    },
+    # APIs lentas, con límite de solicitudes por minuto y errores ocasionales: mide reintentos y esperas
+    "degraded": {
+        "openai": {"latency": 0.2, "jitter": 0.1, "token_latency": 0.01, "rpm": 600, "error_rate": 0.02},
+        "pinecone": {"latency": 0.05, "jitter": 0.03, "rpm": 1200, "error_rate": 0.01},
+    },
+}
+
+# Margen absoluto (ms) además de la tolerancia relativa, para no fallar por ruido en latencias bajas
+ABSOLUTE_SLACK_MS = 50
+# Espera máxima (s) por el siguiente evento de un servicio antes de darlo por colgado
+EVENT_TIMEOUT = 600
+
+
+class LineProcess:
+    """Proceso de un servicio que recibe y emite líneas JSON por stdin/stdout; los eventos se leen en un hilo."""
+
+    def __init__(self, script: str, args: list, env: dict, log_path: str):
+        self.log_path = log_path
+        self.log = open(log_path, "w", encoding="utf-8")
+        self.process = subprocess.Popen(
+            [sys.executable, script, *args],
+            cwd=os.path.dirname(script),
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self.log,
+            text=True,
+            encoding="utf-8",
+            bufsize=1
+        )
+        self.events = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                # Salida de alguna biblioteca, no es un evento
+                continue
+            self.events.put((time.perf_counter(), event))
+        self.events.put((time.perf_counter(), None))
+
+    def send(self, payload: dict):
+        self.process.stdin.write(json.dumps(payload) + "\n")
+        self.process.stdin.flush()
+
+    def next_event(self) -> tuple:
+        """(instante de llegada, evento) del siguiente evento emitido."""
+        try:
+            at, event = self.events.get(timeout=EVENT_TIMEOUT)
+        except queue.Empty:
+            raise RuntimeError(f"Sin respuesta en {EVENT_TIMEOUT} s (ver {self.log_path})")
+        if event is None:
+            raise RuntimeError(f"El proceso terminó antes de tiempo (ver {self.log_path})")
+        return at, event
+
+    def wait_for(self, name: str):
+        while self.next_event()[1].get("event") != name:
+            pass
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait(timeout=EVENT_TIMEOUT)
+        self.log.close()
+
+
+def percentiles(values: list) -> dict:
+    """p50, p95 y p99 en ms (rango más cercano) de duraciones en segundos."""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(values)
+    return {
+        name: round(ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)] * 1000, 1)
+        for name, q in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+    }
+
+
+def add_metrics(stages: dict, counters: Counter, metrics: dict):
+    """Acumula las etapas (segundos) y contadores de la respuesta de un servicio."""
+    for name, entry in (metrics or {}).get("stages", {}).items():
+        stages[name] = stages.get(name, 0.0) + entry["seconds"]
+    counters.update((metrics or {}).get("counters", {}))
+
+
+def run_ingestion(jobs: list, env: dict, concurrency: int, log_path: str) -> dict:
+    """Indexa los documentos con el proceso residente de indexación; mide desde el primer trabajo enviado."""
+    worker = LineProcess(WORKER, ["--concurrency", str(concurrency)], env, log_path)
+    worker.send({"op": "ping"})
+    worker.wait_for("pong")
+
+    started = time.perf_counter()
+    for number, job in enumerate(jobs):
+        worker.send({**job, "jobId": number, "metrics": True})
+
+    progress = {}
+    results = {}
+    finished = started
+    while len(results) < len(jobs):
+        at, event = worker.next_event()
+        if event.get("event") not in ("progress", "result"):
+            continue
+        number = event.get("jobId")
+        # Cada evento debe traer exactamente el jobId enviado; otro id dejaría al benchmark esperando
+        if not isinstance(number, int) or not 0 <= number < len(jobs) or number in results:
+            raise RuntimeError(f"Evento con jobId inesperado {number!r} (ver {log_path})")
+        if event["event"] == "progress":
+            progress[number] = event
+        else:
+            results[number] = event["result"]
+            finished = at
+    worker.close()
+
+    elapsed = finished - started
+    fragments = sum(event["fragments"] for event in progress.values())
+    stages = {}
+    counters = Counter()
+    by_kind = {}
+    for number, result in results.items():
+        add_metrics(stages, counters, result.get("metrics"))
+        kind = by_kind.setdefault(jobs[number].get("kind", "otro"), {"documents": 0, "seconds": 0.0})
+        kind["documents"] += 1
+        kind["seconds"] += (result.get("metrics") or {}).get("totalSeconds", 0.0)
+    return {
+        "documents": len(jobs),
+        "failed": sum(1 for result in results.values() if not result.get("success")),
+        "fragments": fragments,
+        "indexed": sum(event["indexed"] for event in progress.values()),
+        "seconds": round(elapsed, 3),
+        "docsPerSecond": round(len(jobs) / elapsed, 3),
+        "fragmentsPerSecond": round(fragments / elapsed, 2),
+        # Segundos por documento según el formato (tiempo de procesamiento, sin la espera en la cola)
+        "secondsPerDocument": {name: round(entry["seconds"] / entry["documents"], 3) for name, entry in sorted(by_kind.items())},
+        "stages": {name: round(seconds, 3) for name, seconds in sorted(stages.items(), key=lambda item: -item[1])},
+        "counters": dict(counters),
+    }
+
+
+def run_questions(workload: list, env: dict, concurrency: int, log_path: str) -> dict:
+    """Responde la carga con el proceso residente de preguntas, manteniendo concurrency preguntas en curso."""
+    server = LineProcess(QUESTIONS_SERVER, ["--concurrency", str(concurrency)], env, log_path)
+    # El servidor atiende stdin después de crear los clientes y cargar los centroides
+    server.send({"op": "health", "id": "warm-up"})
+    server.wait_for("health")
+
+    pending = iter(enumerate(workload))
+    sent = {}
+    first_delta = {}
+    latencies = []
+    first_token = []
+    errors = 0
+    stages = {}
+    counters = Counter()
+
+    def send_next():
+        item = next(pending, None)
+        if item is not None:
+            number, payload = item
+            sent[number] = time.perf_counter()
+            server.send({**payload, "id": number})
+
+    started = time.perf_counter()
+    for _ in range(concurrency):
+        send_next()
+    done = 0
+    while done < len(workload):
+        at, event = server.next_event()
+        request_id = event.get("id")
+        if event.get("event") == "delta":
+            first_delta.setdefault(request_id, at)
+            continue
+        if event.get("event") not in ("result", "error") or request_id not in sent:
+            continue
+        done += 1
+        latencies.append(at - sent[request_id])
+        if request_id in first_delta:
+            first_token.append(first_delta[request_id] - sent[request_id])
+        if event["event"] == "error":
+            errors += 1
+        else:
+            add_metrics(stages, counters, event["result"].get("metrics"))
+        send_next()
+    elapsed = time.perf_counter() - started
+    server.close()
+
+    answered = len(workload) - errors
+    return {
+        "questions": len(workload),
+        "failed": errors,
+        "seconds": round(elapsed, 3),
+        "questionsPerSecond": round(len(workload) / elapsed, 3),
+        "latency": percentiles(latencies),
+        "firstToken": percentiles(first_token),
+        # Milisegundos por pregunta en cada etapa (promedio)
+        "stages": {name: round(seconds / max(answered, 1) * 1000, 1) for name, seconds in sorted(stages.items(), key=lambda item: -item[1])},
+        "counters": dict(counters),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regresiones respecto a la línea base: menos throughput o más latencia que lo tolerado."""
+    regressions = []
+    for metric in ("docsPerSecond", "fragmentsPerSecond"):
+        expected = baseline.get("ingestion", {}).get(metric)
+        if expected and results["ingestion"][metric] < expected / tolerance:
+            regressions.append(f"indexación {metric}: {results['ingestion'][metric]} (línea base {expected})")
+    for group in ("latency", "firstToken"):
+        for name, expected in baseline.get("questions", {}).get(group, {}).items():
+            measured = results.get("questions", {}).get(group, {}).get(name)
+            if expected is not None and measured is not None and measured > expected * tolerance + ABSOLUTE_SLACK_MS:
+                regressions.append(f"preguntas {group} {name}: {measured} ms (línea base {expected} ms)")
+    return regressions
+
+
+def print_report(results: dict):
+    ingestion = results["ingestion"]
+    print(f"Escenario {results['scenario']} ({results['parameters']['kinds']})")
+    print(
+        f"Indexación: {ingestion['docsPerSecond']} docs/s, {ingestion['fragmentsPerSecond']} fragmentos/s "
+        f"({ingestion['documents']} documentos, {ingestion['fragments']} fragmentos, {ingestion['failed']} con error, {ingestion['seconds']} s)"
+    )
+    print("  s/documento: " + ", ".join(f"{name} {seconds}" for name, seconds in ingestion["secondsPerDocument"].items()))
+    print("  etapas (s): " + ", ".join(f"{name} {seconds}" for name, seconds in ingestion["stages"].items()))
+    questions = results.get("questions")
+    if questions:
+        latency, first = questions["latency"], questions["firstToken"]
+        print(
+            f"Preguntas: p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms; "
+            f"primer fragmento p50 {first['p50']} ms, p95 {first['p95']} ms "
+            f"({questions['questions']} preguntas, {questions['failed']} con error, {questions['questionsPerSecond']} preguntas/s)"
+        )
+        print("  etapas (ms por pregunta): " + ", ".join(f"{name} {ms}" for name, ms in questions["stages"].items()))
+    for name, stats in results["standIns"].items():
+        print(f"{name}: {stats.get('requests', 0)} solicitudes, {stats.get('throttled', 0)} limitadas (429), {stats.get('errors', 0)} errores inyectados")
+
+
+def load_baseline() -> dict:
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de indexación y preguntas contra OpenAI y Pinecone simulados.")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="default")
+    parser.add_argument("--documents", type=int, default=24)
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--kinds", default=",".join(corpus.KINDS), help="Formatos del corpus, separados por comas.")
+    parser.add_argument("--questions", type=int, default=200, help="Preguntas de la carga (0 = solo indexación).")
+    parser.add_argument("--corpus", help="Directorio con un corpus ya generado (manifest.json y questions.jsonl).")
+    parser.add_argument("--workload", help="Carga de preguntas a reproducir (JSON lines con payloads de questionsService).")
+    parser.add_argument("--ingestion-concurrency", type=int, default=2, help="Documentos indexados simultáneamente.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Preguntas en curso simultáneamente.")
+    parser.add_argument("--vector-backend", default="pinecone", help="VECTOR_BACKEND de los servicios (pinecone, local o both).")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Factor máximo respecto a la línea base.")
+    parser.add_argument("--update-baseline", action="store_true", help="Guarda los resultados como línea base del escenario.")
+    parser.add_argument("--output", help="Archivo JSON donde guardar los resultados completos.")
+    parser.add_argument("--keep", action="store_true", help="Conserva el directorio de trabajo (corpus, estado y registros).")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="ciudadano-benchmark-")
+    openai, pinecone = start_stand_ins(seed=args.seed, **SCENARIOS[args.scenario])
+    completed = False
+    try:
+        if args.corpus:
+            jobs = corpus.load_manifest(args.corpus)
+            workload = corpus.load_workload(args.workload or os.path.join(args.corpus, "questions.jsonl"))
+        else:
+            kinds = args.kinds.split(",")
+            if "scanned-pdf" in kinds and not shutil.which(os.getenv("TESSERACT_CMD") or "tesseract"):
+                print("Tesseract no está instalado: se omiten los PDF escaneados.")
+                kinds.remove("scanned-pdf")
+            jobs, workload = corpus.generate(os.path.join(workdir, "corpus"), args.documents, args.questions, args.pages, kinds, args.seed)
+            if args.workload:
+                workload = corpus.load_workload(args.workload)
+        workload = workload[:args.questions]
+
+        env = {
+            **os.environ,
+            **stand_in_env(openai, pinecone),
+            # Estado local nuevo en cada ejecución: las cachés empiezan vacías
+            "SERVICES_CACHE_DIR": os.path.join(workdir, "cache"),
+            "VECTOR_BACKEND": args.vector_backend,
+            "PYTHONUNBUFFERED": "1",
+        }
+        results = {
+            "scenario": args.scenario,
+            "parameters": {
+                "documents": len(jobs),
+                "kinds": ",".join(sorted({job.get("kind", "otro") for job in jobs})),
+                "questions": len(workload),
+                "ingestionConcurrency": args.ingestion_concurrency,
+                "concurrency": args.concurrency,
+                "vectorBackend": args.vector_backend,
+            },
+        }
+        results["ingestion"] = run_ingestion(jobs, env, args.ingestion_concurrency, os.path.join(workdir, "ingestion.log"))
+        if workload:
+            results["questions"] = run_questions(workload, env, args.concurrency, os.path.join(workdir, "questions.log"))
+        results["standIns"] = {"openai": openai.stats(), "pinecone": pinecone.stats()}
+        completed = True
+    finally:
+        openai.close()
+        pinecone.close()
+        # Si algo falla se conservan los registros de los servicios
+        if completed and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        elif not completed:
+            print(f"Directorio de trabajo: {workdir}")
+
+    print_report(results)
+    if args.keep:
+        print(f"Directorio de trabajo: {workdir}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    baselines = load_baseline()
+    baseline = baselines.get(args.scenario)
+    regressions = []
+    if args.update_baseline:
+        baselines[args.scenario] = {
+            "parameters": results["parameters"],
+            "ingestion": {metric: results["ingestion"][metric] for metric in ("docsPerSecond", "fragmentsPerSecond")},
+            "questions": {group: results["questions"][group] for group in ("latency", "firstToken")} if "questions" in results else {},
+        }
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"Línea base actualizada: {BASELINE_PATH}")
+    elif not baseline:
+        print(f"SIN LÍNEA BASE para el escenario {args.scenario} en {BASELINE_PATH}: no se comparó nada. "
+              "Ejecuta con --update-baseline para registrarla.", file=sys.stderr)
+    elif baseline["parameters"] != results["parameters"]:
+        print("Los parámetros difieren de los de la línea base: no se compara.")
+    else:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regresión: {regression}")
+        if not regressions:
+            print("Sin regresiones respecto a la línea base.")
+
+    failed = results["ingestion"]["failed"] or (results.get("questions") or {}).get("failed")
+    if failed and args.scenario == "default":
+        print("Hubo documentos o preguntas con error en un escenario sin fallas inyectadas.")
+    if regressions or (failed and args.scenario == "default"):
+        sys.exit(1)
+    sys.exit(2 if not baseline and not args.update_baseline else 0)
+
+
+if __name__ == "__main__":
+    main()
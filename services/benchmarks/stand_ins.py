@@ -0,0 +1,524 @@
+"""Servidores HTTP locales que reemplazan a OpenAI y Pinecone en los benchmarks (sin red ni costo).
+
+- OpenAI: /v1/embeddings (embeddings deterministas a partir de las palabras del texto, así preguntas y
+  fragmentos que comparten vocabulario son similares) y /v1/chat/completions (respuestas sintéticas según
+  el prompt: categorías, arreglos JSON de categorías, nombres de chat, resúmenes y respuestas, con streaming).
+- Pinecone: plano de datos (upsert, fetch, query con filtros de metadatos, update, delete, list y
+  describe_index_stats) sobre un índice en memoria.
+
+Cada servidor tiene latencia configurable (con variación aleatoria y, en el streaming, por token), límite de
+solicitudes por minuto (responde 429 con Retry-After) y una proporción de errores 500/503 inyectados.
+Los servicios se apuntan a estos servidores con OPENAI_BASE_URL y PINECONE_HOST (ver stand_in_env).
+
+Uso:
+    python services/benchmarks/stand_ins.py [--openai-port 8801] [--pinecone-port 8802] [--openai-latency 0.08]
+        [--openai-rpm 600] [--openai-error-rate 0.02] [--pinecone-latency 0.02] ...
+"""
+import argparse
+import ast
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from urllib.parse import parse_qs, urlparse
+
+EMBEDDING_DIMENSION = 1536
+# Caracteres por token usados para reportar el uso (como la estimación de los servicios)
+CHARS_PER_TOKEN = 4
+# Palabras de la respuesta sintética a una pregunta
+ANSWER_WORDS = 120
+
+# Palabras vacías que no aportan al embedding sintético
+STOPWORDS = set("""
+a al ante como con cual cuales de del desde donde el ella ellas ellos en entre es esta este esto fue ha hay la las lo los
+mas me mi muy no o para pero por que quien se ser si sin sobre son su sus te tu un una uno unos y ya
+""".split())
+_WORDS = re.compile(r"[a-z0-9]+")
+
+
+class Faults:
+    """Latencia, límite de solicitudes por minuto y errores inyectados de un servicio simulado."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rpm: int = 0, error_rate: float = 0.0, token_latency: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.token_latency = token_latency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.allowance = float(rpm)
+        self.checked = time.monotonic()
+        self.stats = Counter()
+
+    def wait(self):
+        """Simula la latencia de red y de procesamiento de la solicitud."""
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def admit(self):
+        """None si la solicitud se atiende; si no, (estado, encabezados, cuerpo) de la falla simulada."""
+        with self.lock:
+            self.stats["requests"] += 1
+            if self.rpm:
+                # Cubeta de solicitudes que se rellena de forma continua hasta rpm
+                now = time.monotonic()
+                self.allowance = min(self.rpm, self.allowance + (now - self.checked) * self.rpm / 60)
+                self.checked = now
+                if self.allowance < 1:
+                    self.stats["throttled"] += 1
+                    retry = (1 - self.allowance) * 60 / self.rpm
+                    headers = {"Retry-After": str(math.ceil(retry)), "retry-after-ms": str(int(retry * 1000))}
+                    return 429, headers, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+                self.allowance -= 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                status = self.random.choice([500, 503])
+                return status, {}, {"error": {"message": "Injected failure", "type": "server_error", "code": status}}
+        return None
+
+
+def terms(text: str) -> list:
+    """Palabras del texto en minúsculas y sin tildes, sin palabras vacías."""
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("ascii")
+    return [word for word in _WORDS.findall(text) if word not in STOPWORDS]
+
+
+@lru_cache(maxsize=65536)
+def word_vector(word: str):
+    import numpy as np
+
+    seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSION).astype(np.float32)
+
+
+def embed(text: str):
+    """Embedding normalizado: suma de un vector pseudoaleatorio fijo por palabra."""
+    import numpy as np
+
+    vector = np.zeros(EMBEDDING_DIMENSION, dtype=np.float32)
+    for word in terms(text) or ["vacio"]:
+        vector += word_vector(word)
+    return vector / (np.linalg.norm(vector) + 1e-12)
+
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def prompt_categories(prompt: str) -> list:
+    """Lista de categorías incluida en el prompt (como lista de Python), o una genérica."""
+    match = re.search(r"categorías:?\s*(\[.*?\])", prompt, re.S)
+    if match:
+        try:
+            categories = [str(category) for category in ast.literal_eval(match.group(1))]
+            if categories:
+                return categories
+        except (ValueError, SyntaxError):
+            pass
+    return ["General"]
+
+
+def pick(options: list, text: str):
+    """Opción determinista para text: la que más palabras comparte con él o, si empatan, una según su hash."""
+    words = set(terms(text))
+    scores = [len(words & set(terms(option))) for option in options]
+    best = max(scores)
+    candidates = [option for option, score in zip(options, scores) if score == best]
+    return candidates[int(hashlib.md5(text.encode("utf-8")).hexdigest(), 16) % len(candidates)]
+
+
+def reply(prompt: str) -> str:
+    """Respuesta sintética con la forma que espera cada prompt de los servicios."""
+    batch = re.search(r"arreglo JSON de (\d+) cadenas", prompt)
+    if batch:
+        categories = prompt_categories(prompt)
+        lines = re.findall(r"^\s*\d+\. (.*)$", prompt.split("Textos:", 1)[-1], re.M)
+        lines += [""] * (int(batch.group(1)) - len(lines))
+        return json.dumps([pick(categories, line) for line in lines[:int(batch.group(1))]], ensure_ascii=False)
+    if "nombre de la categoría" in prompt:
+        return pick(prompt_categories(prompt), prompt.rsplit("Pregunta:", 1)[-1])
+    if "nombre breve" in prompt:
+        question = prompt.split("pregunta:", 1)[-1].split("NO la respondas", 1)[0]
+        return "Consulta sobre " + " ".join(terms(question)[:3])
+    if "Actualiza el resumen" in prompt:
+        return "El estudiante preguntó sobre " + " ".join(terms(prompt)[-40:]) + "."
+    # Respuesta a una pregunta: palabras del contexto del prompt, en un orden determinista
+    words = [word for word in prompt.split() if word.isalpha()] or ["respuesta"]
+    rng = random.Random(prompt)
+    return " ".join(rng.choice(words) for _ in range(ANSWER_WORDS)) + "."
+
+
+class OpenAIStandIn:
+    """Rutas de la API de OpenAI que usan los servicios."""
+
+    name = "openai"
+
+    def __init__(self, faults: Faults):
+        self.faults = faults
+        self.ids = count(1)
+
+    def handle(self, method: str, path: str, query: dict, body: dict):
+        if method == "POST" and path == "/v1/embeddings":
+            return 200, {}, self.embeddings(body)
+        if method == "POST" and path == "/v1/chat/completions":
+            return self.chat(body)
+        return 404, {}, {"error": {"message": f"Ruta no simulada: {method} {path}"}}
+
+    def embeddings(self, body: dict) -> dict:
+        import numpy as np
+
+        texts = body.get("input")
+        texts = [texts] if isinstance(texts, str) else texts
+        data = []
+        for i, text in enumerate(texts):
+            vector = embed(text)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype(np.float32).tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        tokens = sum(count_tokens(text) for text in texts)
+        return {"object": "list", "data": data, "model": body.get("model"), "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    def chat(self, body: dict):
+        prompt = "\n".join(str(message.get("content") or "") for message in body.get("messages", []))
+        content = reply(prompt)
+        usage = {"prompt_tokens": count_tokens(prompt), "completion_tokens": count_tokens(content)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": f"chatcmpl-bench-{next(self.ids)}", "created": int(time.time()), "model": body.get("model")}
+
+        if not body.get("stream"):
+            return 200, {}, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop", "logprobs": None}],
+                "usage": usage,
+            }
+
+        def events():
+            words = content.split(" ")
+            for i, word in enumerate(words):
+                if i and self.faults.token_latency:
+                    time.sleep(self.faults.token_latency)
+                delta = {"role": "assistant", "content": word} if i == 0 else {"content": " " + word}
+                yield {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            yield {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+
+        return 200, {"Content-Type": "text/event-stream"}, events()
+
+
+class PineconeStandIn:
+    """Plano de datos de un índice de Pinecone (métrica coseno) en memoria, por namespace."""
+
+    name = "pinecone"
+
+    def __init__(self, faults: Faults, dimension: int = EMBEDDING_DIMENSION):
+        self.faults = faults
+        self.dimension = dimension
+        self.lock = threading.Lock()
+        self.namespaces = {}
+        # Matriz normalizada por namespace, se reconstruye tras cada escritura
+        self.matrices = {}
+
+    def handle(self, method: str, path: str, query: dict, body: dict):
+        namespace = body.get("namespace") or (query.get("namespace") or [""])[0]
+        routes = {
+            ("POST", "/vectors/upsert"): self.upsert,
+            ("POST", "/query"): self.query,
+            ("GET", "/vectors/fetch"): self.fetch,
+            ("POST", "/vectors/update"): self.update,
+            ("POST", "/vectors/delete"): self.delete,
+            ("GET", "/vectors/list"): self.list,
+            ("POST", "/describe_index_stats"): self.stats,
+            ("GET", "/describe_index_stats"): self.stats,
+        }
+        route = routes.get((method, path))
+        if route is None:
+            return 404, {}, {"code": 5, "message": f"Ruta no simulada: {method} {path}"}
+        with self.lock:
+            return 200, {}, route(self.namespaces.setdefault(namespace, {}), namespace, query, body)
+
+    def upsert(self, vectors: dict, namespace: str, query: dict, body: dict) -> dict:
+        for vector in body.get("vectors", []):
+            vectors[vector["id"]] = (vector["values"], vector.get("metadata") or {})
+        self.matrices.pop(namespace, None)
+        return {"upsertedCount": len(body.get("vectors", []))}
+
+    def fetch(self, vectors: dict, namespace: str, query: dict, body: dict) -> dict:
+        found = {
+            vector_id: {"id": vector_id, "values": vectors[vector_id][0], "metadata": vectors[vector_id][1]}
+            for vector_id in query.get("ids", []) if vector_id in vectors
+        }
+        return {"vectors": found, "namespace": namespace, "usage": {"readUnits": 1}}
+
+    def update(self, vectors: dict, namespace: str, query: dict, body: dict) -> dict:
+        if body.get("id") in vectors:
+            values, metadata = vectors[body["id"]]
+            vectors[body["id"]] = (body.get("values") or values, {**metadata, **(body.get("setMetadata") or {})})
+            self.matrices.pop(namespace, None)
+        return {}
+
+    def delete(self, vectors: dict, namespace: str, query: dict, body: dict) -> dict:
+        if body.get("deleteAll"):
+            vectors.clear()
+        for vector_id in body.get("ids") or []:
+            vectors.pop(vector_id, None)
+        if body.get("filter"):
+            for vector_id in [vector_id for vector_id, (_, metadata) in vectors.items() if matches(metadata, body["filter"])]:
+                del vectors[vector_id]
+        self.matrices.pop(namespace, None)
+        return {}
+
+    def list(self, vectors: dict, namespace: str, query: dict, body: dict) -> dict:
+        prefix = (query.get("prefix") or [""])[0]
+        limit = int((query.get("limit") or [100])[0])
+        start = (query.get("paginationToken") or [""])[0]
+        ids = sorted(vector_id for vector_id in vectors if vector_id.startswith(prefix) and vector_id > start)
+        page = ids[:limit]
+        response = {"vectors": [{"id": vector_id} for vector_id in page], "namespace": namespace, "usage": {"readUnits": 1}}
+        if len(ids) > limit:
+            response["pagination"] = {"next": page[-1]}
+        return response
+
+    def stats(self, vectors: dict, namespace: str, query: dict, body: dict) -> dict:
+        counts = {name: {"vectorCount": len(entries)} for name, entries in self.namespaces.items()}
+        return {"namespaces": counts, "dimension": self.dimension, "indexFullness": 0.0, "totalVectorCount": sum(len(entries) for entries in self.namespaces.values())}
+
+    def query(self, vectors: dict, namespace: str, query: dict, body: dict) -> dict:
+        """Top-k por similitud coseno entre los vectores que cumplen el filtro (búsqueda exhaustiva)."""
+        import numpy as np
+
+        if namespace not in self.matrices:
+            ids = list(vectors)
+            matrix = np.asarray([vectors[vector_id][0] for vector_id in ids], dtype=np.float32).reshape(len(ids), self.dimension)
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+            self.matrices[namespace] = (ids, matrix)
+        ids, matrix = self.matrices[namespace]
+
+        vector = np.asarray(body["vector"], dtype=np.float32)
+        scores = matrix @ (vector / (np.linalg.norm(vector) + 1e-12))
+        if body.get("filter"):
+            mask = np.fromiter((matches(vectors[vector_id][1], body["filter"]) for vector_id in ids), dtype=bool, count=len(ids))
+            scores = np.where(mask, scores, -np.inf)
+        top_k = min(int(body.get("topK", 10)), int(np.isfinite(scores).sum()))
+        best = np.argsort(-scores)[:top_k] if top_k > 0 else []
+        return {
+            "matches": [
+                {
+                    "id": ids[row],
+                    "score": float(scores[row]),
+                    "values": vectors[ids[row]][0] if body.get("includeValues") else [],
+                    **({"metadata": vectors[ids[row]][1]} if body.get("includeMetadata") else {}),
+                }
+                for row in best
+            ],
+            "namespace": namespace,
+            "usage": {"readUnits": 5},
+        }
+
+
+def matches(metadata: dict, filter: dict) -> bool:
+    """Evalúa un filtro de metadatos de Pinecone ($eq, $ne, $in, $nin, $gt, $gte, $lt, $lte, $exists, $and, $or)."""
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches(metadata, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, part) for part in condition):
+                return False
+        else:
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            value = metadata.get(key)
+            for operator, expected in condition.items():
+                if operator == "$exists":
+                    if (key in metadata) != bool(expected):
+                        return False
+                    continue
+                if key not in metadata:
+                    if operator in ("$ne", "$nin"):
+                        continue
+                    return False
+                try:
+                    ok = {
+                        "$eq": lambda: value == expected,
+                        "$ne": lambda: value != expected,
+                        "$in": lambda: value in expected,
+                        "$nin": lambda: value not in expected,
+                        "$gt": lambda: value > expected,
+                        "$gte": lambda: value >= expected,
+                        "$lt": lambda: value < expected,
+                        "$lte": lambda: value <= expected,
+                    }[operator]()
+                except TypeError:
+                    # Pinecone no compara números con texto
+                    ok = False
+                if not ok:
+                    return False
+    return True
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Atiende las solicitudes del servicio simulado (self.server.app) aplicando sus fallas configuradas."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method: str):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        app = self.server.app
+
+        app.faults.wait()
+        failure = app.faults.admit()
+        if failure:
+            self.send_json(*failure)
+            return
+        try:
+            status, headers, payload = app.handle(method, url.path.rstrip("/") or "/", parse_qs(url.query), json.loads(raw) if raw else {})
+        except Exception as e:
+            with app.faults.lock:
+                app.faults.stats["handlerErrors"] += 1
+            self.send_json(500, {}, {"error": {"message": f"{type(e).__name__}: {e}"}})
+            return
+        if isinstance(payload, dict):
+            self.send_json(status, headers, payload)
+        else:
+            self.send_events(status, headers, payload)
+
+    def send_json(self, status: int, headers: dict, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self, status: int, headers: dict, events):
+        """Server-sent events con codificación chunked (la conexión se mantiene abierta para la siguiente solicitud)."""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        for event in events:
+            chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class StandIn:
+    """Servidor de un servicio simulado en un hilo de este proceso (port=0: puerto libre)."""
+
+    def __init__(self, app, port: int = 0):
+        self.app = app
+        self.server = StandInServer(("127.0.0.1", port), Handler)
+        self.server.app = app
+        self.thread = threading.Thread(target=self.server.serve_forever, name=f"stand-in-{app.name}", daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stats(self) -> dict:
+        return dict(self.app.faults.stats)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_stand_ins(openai: dict = None, pinecone: dict = None, openai_port: int = 0, pinecone_port: int = 0, seed: int = 0) -> tuple:
+    """Levanta los dos servidores; openai y pinecone son los parámetros de Faults de cada uno."""
+    return (
+        StandIn(OpenAIStandIn(Faults(seed=seed, **(openai or {}))), openai_port),
+        StandIn(PineconeStandIn(Faults(seed=seed + 1, **(pinecone or {}))), pinecone_port),
+    )
+
+
+def stand_in_env(openai: StandIn, pinecone: StandIn) -> dict:
+    """Variables de entorno que apuntan los servicios a los servidores simulados."""
+    return {
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"{openai.url}/v1",
+        "PINECONE_API_KEY": "benchmark",
+        "PINECONE_HOST": pinecone.url,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidores locales que reemplazan a OpenAI y Pinecone.")
+    parser.add_argument("--openai-port", type=int, default=8801)
+    parser.add_argument("--pinecone-port", type=int, default=8802)
+    parser.add_argument("--openai-latency", type=float, default=0.08, help="Segundos por solicitud (hasta el primer token).")
+    parser.add_argument("--openai-jitter", type=float, default=0.04, help="Variación aleatoria adicional (s).")
+    parser.add_argument("--openai-token-latency", type=float, default=0.005, help="Segundos entre tokens en streaming.")
+    parser.add_argument("--openai-rpm", type=int, default=0, help="Solicitudes por minuto antes de responder 429 (0 = sin límite).")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0, help="Proporción de solicitudes que fallan con 500/503.")
+    parser.add_argument("--pinecone-latency", type=float, default=0.02)
+    parser.add_argument("--pinecone-jitter", type=float, default=0.01)
+    parser.add_argument("--pinecone-rpm", type=int, default=0)
+    parser.add_argument("--pinecone-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    openai, pinecone = start_stand_ins(
+        openai={"latency": args.openai_latency, "jitter": args.openai_jitter, "token_latency": args.openai_token_latency, "rpm": args.openai_rpm, "error_rate": args.openai_error_rate},
+        pinecone={"latency": args.pinecone_latency, "jitter": args.pinecone_jitter, "rpm": args.pinecone_rpm, "error_rate": args.pinecone_error_rate},
+        openai_port=args.openai_port,
+        pinecone_port=args.pinecone_port,
+        seed=args.seed
+    )
+    for name, value in stand_in_env(openai, pinecone).items():
+        print(f"{name}={value}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps({"openai": openai.stats(), "pinecone": pinecone.stats()}))
+        openai.close()
+        pinecone.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Benchmark de arranque de los servicios Python.
+
+Importa cada punto de entrada en un intérprete nuevo, mide el tiempo de importación (mediana de varias
+corridas) y verifica que no se carguen al iniciar dependencias que solo se necesitan en el primer uso.
+Los tiempos se comparan con baselines/startup.json; el proceso termina con código 1 si hay regresión.
+La línea base depende de la máquina y no se incluye en el repositorio: la primera ejecución en cada máquina
+debe usar --update-baseline; sin línea base el proceso termina con código 2 (los imports pesados se verifican igual).
+
+Uso:
+    python services/benchmarks/startup.py [--runs 5] [--tolerance 1.5] [--update-baseline]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SERVICES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "startup.json")
+
+# Dependencias pesadas que ningún punto de entrada debe importar al iniciar
+HEAVY_MODULES = ["openai", "pinecone", "fitz", "docx", "pptx", "pytesseract", "PIL", "pdf2image", "langchain_text_splitters"]
+
+# Nombre del benchmark: (directorio del servicio, módulo a importar)
+ENTRY_POINTS = {
+    "processDocumentService.main": ("processDocumentService", "main"),
+    "processDocumentService.main_delete": ("processDocumentService", "main_delete"),
+    "processDocumentService.worker": ("processDocumentService", "worker"),
+    "questionsService.main": ("questionsService", "main"),
+    "questionsService.server": ("questionsService", "server"),
+}
+
+# Margen absoluto (ms) además de la tolerancia relativa, para no fallar por ruido en importaciones muy rápidas
+ABSOLUTE_SLACK_MS = 25
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {service_dir!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(service: str, module: str, runs: int) -> dict:
+    """Importa el módulo en runs intérpretes nuevos; devuelve la mediana en ms y los módulos pesados cargados."""
+    service_dir = os.path.join(SERVICES_DIR, service)
+    code = PROBE.format(service_dir=service_dir, module=module, heavy=HEAVY_MODULES)
+    timings = []
+    heavy = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=service_dir,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result["ms"])
+        heavy.update(result["heavy"])
+    return {"ms": round(statistics.median(timings), 2), "heavy": sorted(heavy)}
+
+
+def load_baseline() -> dict:
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de arranque de los servicios Python.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Factor máximo respecto a la línea base.")
+    parser.add_argument("--update-baseline", action="store_true", help="Guarda los tiempos medidos como línea base.")
+    args = parser.parse_args()
+
+    baseline = load_baseline()
+    results = {}
+    failures = []
+
+    for name, (service, module) in ENTRY_POINTS.items():
+        result = measure(service, module, args.runs)
+        results[name] = result
+
+        status = "ok"
+        if result["heavy"]:
+            status = f"importa al iniciar: {', '.join(result['heavy'])}"
+            failures.append(name)
+        elif name in baseline:
+            budget = baseline[name]["ms"] * args.tolerance + ABSOLUTE_SLACK_MS
+            if result["ms"] > budget:
+                status = f"regresión (límite {budget:.1f} ms)"
+                failures.append(name)
+        print(f"{name:40s} {result['ms']:9.2f} ms  {status}")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump({name: {"ms": result["ms"]} for name, result in results.items()}, f, indent=2)
+        print(f"Línea base actualizada: {BASELINE_PATH}")
+    elif not baseline:
+        print(f"SIN LÍNEA BASE en {BASELINE_PATH}: no se comparó ningún tiempo. "
+              "Ejecuta con --update-baseline para registrarla.", file=sys.stderr)
+
+    if failures:
+        sys.exit(1)
+    sys.exit(2 if not baseline and not args.update_baseline else 0)
+
+
+if __name__ == "__main__":
+    main()
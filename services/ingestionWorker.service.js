@@ -0,0 +1,103 @@
+import { spawn } from 'child_process'
+import { resolve, dirname } from 'path'
+import { fileURLToPath } from 'url'
+import config from 'config'
+import { Logger } from '../utils/logger.js'
+
+const dirPath = dirname(fileURLToPath(import.meta.url))
+const logger = new Logger({ filename: 'ingestion-worker.log' })
+
+let worker = null
+let nextJobId = 1
+const pendingJobs = new Map()
+
+const handleEvent = (line) => {
+  if (!line.trim()) return
+
+  let event
+  try {
+    event = JSON.parse(line)
+  } catch (e) {
+    logger.error(`${line} || ${e.message}`, { title: 'Evento inválido del proceso de indexación' })
+    return
+  }
+
+  const job = pendingJobs.get(event.jobId)
+  if (event.event === 'error') {
+    // Línea rechazada por el proceso (p. ej. JSON inválido): si identifica el trabajo, se rechaza
+    logger.error(event.error, { title: 'Trabajo rechazado por el proceso de indexación' })
+    if (job) {
+      pendingJobs.delete(event.jobId)
+      job.reject(new Error(event.error))
+    }
+    return
+  }
+  if (!job) return
+
+  if (event.event === 'progress') {
+    job.onProgress?.(event)
+  } else if (event.event === 'result') {
+    pendingJobs.delete(event.jobId)
+    job.resolve(event.result)
+  }
+}
+
+const onWorkerLost = (py, reason) => {
+  if (worker !== py) return
+  worker = null
+  logger.error(reason, { title: 'Proceso de indexación detenido' })
+  // Los trabajos en curso se pierden con el proceso: se rechazan para notificar al usuario
+  for (const job of pendingJobs.values()) job.reject(new Error(reason))
+  pendingJobs.clear()
+}
+
+const startWorker = () => {
+  const venvPython = config.get('venvPython')
+  const pythonPath = resolve(dirPath, `../ciudadano_digital/${venvPython}`)
+  const servicePath = resolve(dirPath, './processDocumentService/worker.py')
+
+  const py = spawn(pythonPath, [servicePath], {
+    stdio: ['pipe', 'pipe', 'pipe'],
+    detached: false,
+    env: { ...process.env },
+    shell: false,
+  })
+
+  let buffer = ''
+  py.stdout.on('data', (data) => {
+    buffer += data.toString()
+    const lines = buffer.split('\n')
+    buffer = lines.pop()
+    lines.forEach(handleEvent)
+  })
+
+  py.stderr.on('data', (data) => {
+    logger.error(data.toString(), { title: 'Python stderr' })
+  })
+
+  // Escribir a un proceso que ya terminó (EPIPE) emite 'error' en stdin; sin este listener derriba la API
+  py.stdin.on('error', (error) => onWorkerLost(py, error.message))
+  py.on('error', (error) => {
+    logger.error(error.message, { title: 'Spawn error' })
+    onWorkerLost(py, error.message)
+  })
+  py.on('close', (code) => onWorkerLost(py, `Python terminó con error: ${code}`))
+
+  return py
+}
+
+/**
+ * Envía un documento al proceso residente de indexación (se inicia con el primer trabajo).
+ * @param {object} payload - Mismo payload que recibe processDocumentService/main.py
+ * @param {object} options - onProgress: callback opcional con los eventos de avance
+ * @returns {Promise<object>} Respuesta de main.py ({ success, category } o { success: false, error })
+ */
+export const runIngestionJob = (payload, { onProgress } = {}) => {
+  if (!worker) worker = startWorker()
+
+  const jobId = nextJobId++
+  return new Promise((resolvePromise, reject) => {
+    pendingJobs.set(jobId, { resolve: resolvePromise, reject, onProgress })
+    worker.stdin.write(`${JSON.stringify({ ...payload, jobId })}\n`)
+  })
+}
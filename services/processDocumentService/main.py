@@ -1,9 +1,11 @@
 import sys
 import json
 from utils import *
+from shared.metrics import collect, metrics_requested, profile_requested, profiled
+from shared.scheduler import scheduler_stats
 
 
-def main(filepath: str, filename: str, author: str, year: str, remotepath: str, categories: list, minAge: int, maxAge:int):
+def main(filepath: str, filename: str, author: str, year: str, remotepath: str, categories: list, minAge: int, maxAge:int, on_progress=None, incremental: bool = False, replaces: str = None):
     return process_and_index_document(
         file_path=filepath,
         source_title=filename,
@@ -12,14 +14,15 @@ def main(filepath: str, filename: str, author: str, year: str, remotepath: str,
         identifier=remotepath,
         categories=categories,
         minAge=minAge,
-        maxAge=maxAge
+        maxAge=maxAge,
+        on_progress=on_progress,
+        incremental=incremental,
+        replaces=replaces
     )
 
 
-if __name__ == "__main__":    
-    raw = sys.stdin.read()
-    data = json.loads(raw)
-    
+def run(data: dict, on_progress=None):
+    """Ejecuta main a partir del payload JSON que envía la API."""
     filePath = data.get("filePath")
     fileName = data.get("fileName")
     author = data.get("author")
@@ -28,8 +31,25 @@ if __name__ == "__main__":
     categories = data.get("categories")
     minAge = data.get("minAge")
     maxAge = data.get("maxAge")
+    # Reindexación incremental: compara contra el manifiesto del documento reemplazado (o del mismo remotePath)
+    incremental = bool(data.get("incremental", False))
+    replaces = data.get("replaces")
+
+    # Métricas por etapa ("metrics": true) y perfil cProfile ("profile": true), opcionales
+    with collect(metrics_requested(data)) as metrics, profiled("ingestion", profile_requested(data)) as profile_path:
+        result = main(filePath, fileName, author, year, remotePath, categories, minAge, maxAge, on_progress, incremental, replaces)
+    if metrics is not None:
+        result["metrics"] = {**metrics.as_dict(), "embeddingCache": get_embedding_cache().stats(), "schedulers": scheduler_stats()}
+    if profile_path:
+        result["profile"] = profile_path
+    return result
+
+
+if __name__ == "__main__":    
+    raw = sys.stdin.read()
+    data = json.loads(raw)
     
-    result = main(filePath, fileName, author, year, remotePath, categories, minAge, maxAge)
+    result = run(data)
     
     print(json.dumps(result))
     
@@ -0,0 +1,302 @@
+import argparse
+import contextvars
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from utils import *
+from shared.metrics import collect, current_metrics, metrics_requested
+from shared.scheduler import scheduler_stats
+
+# Extensiones que se toman al recorrer un directorio
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".doc", ".pptx", ".txt", ".md", ".png", ".jpg", ".jpeg", ".tif", ".tiff"}
+
+
+def load_jobs(source: str, defaults: dict) -> list:
+    """Lee los documentos a indexar desde un directorio o un manifiesto CSV/JSON.
+
+    Cada entrada del manifiesto puede indicar filePath (relativa al manifiesto), fileName, author, year, minAge,
+    maxAge, categories (lista o separadas por ";") y remotePath; lo que falte se toma de los valores por defecto.
+    """
+    if os.path.isdir(source):
+        entries = []
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                    path = os.path.join(root, name)
+                    entries.append({"filePath": path, "remotePath": os.path.relpath(path, source).replace(os.sep, "/")})
+        base_dir = source
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            entries = json.load(f) if source.lower().endswith(".json") else list(csv.DictReader(f))
+        base_dir = os.path.dirname(os.path.abspath(source))
+
+    jobs = []
+    for number, entry in enumerate(entries, 1):
+        entry = {key: value for key, value in entry.items() if value not in (None, "")}
+        path = entry.get("filePath") or entry.get("path")
+        if not path:
+            raise ValueError(f"{source}: la entrada {number} no indica filePath ni path")
+        if not os.path.isabs(path):
+            path = os.path.join(base_dir, path)
+        categories = entry.get("categories", defaults["categories"])
+        if isinstance(categories, str):
+            categories = [c.strip() for c in categories.split(";") if c.strip()]
+        remote = entry.get("remotePath") or os.path.basename(path)
+
+        jobs.append({
+            "file_path": path,
+            "source_title": entry.get("fileName") or os.path.splitext(os.path.basename(path))[0],
+            "author": entry.get("author", defaults["author"]),
+            "year": entry.get("year", defaults["year"]),
+            "identifier": f"{defaults['prefix']}{remote}",
+            "categories": categories,
+            "minAge": int(entry["minAge"]) if "minAge" in entry else defaults["minAge"],
+            "maxAge": int(entry["maxAge"]) if "maxAge" in entry else defaults["maxAge"],
+        })
+    return jobs
+
+
+class Checkpoint:
+    """Registro (JSON lines) de documentos ya procesados para poder reanudar la ejecución."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        if record.get("status") == "ok":
+                            self.done.add(record["identifier"])
+
+    def record(self, entry: dict):
+        with self.lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            if entry["status"] == "ok":
+                self.done.add(entry["identifier"])
+
+
+class FileRun:
+    """Estado de un documento mientras sus lotes atraviesan el pipeline."""
+
+    def __init__(self, job: dict):
+        self.job = job
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.seen = set()
+        self.owned = {}
+        self.votes = {}
+        self.pending_batches = 0
+        self.extraction_done = False
+        self.finished = False
+        self.fragments = 0
+        self.indexed = 0
+        self.near_duplicates = 0
+        self.tokens = 0
+        self.error = None
+
+
+class BatchIngestion:
+    """Pipeline por etapas: extracción/OCR (CPU) y verificación/embeddings/carga (red) conectadas por una cola acotada."""
+
+    def __init__(self, jobs: list, checkpoint: Checkpoint, extract_workers: int, index_workers: int, queue_size: int):
+        self.jobs = [job for job in jobs if job["identifier"] not in checkpoint.done]
+        self.skipped = len(jobs) - len(self.jobs)
+        self.checkpoint = checkpoint
+        self.extract_workers = extract_workers
+        self.index_workers = index_workers
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.jobs_queue = queue.Queue()
+        self.output_lock = threading.Lock()
+        self.totals = {"docs": 0, "failed": 0, "fragments": 0, "indexed": 0, "tokens": 0}
+
+    def emit(self, event: dict):
+        with self.output_lock:
+            print(json.dumps(event), flush=True)
+
+    def extract(self):
+        while True:
+            try:
+                job = self.jobs_queue.get_nowait()
+            except queue.Empty:
+                return
+            run = FileRun(job)
+            try:
+                for fragments in batched(iter_document_fragments(job["file_path"]), PIPELINE_BATCH_SIZE):
+                    with run.lock:
+                        run.pending_batches += 1
+                    # put bloquea si la etapa de red va atrasada: la extracción no acumula memoria sin límite
+                    self.batches.put((run, fragments))
+            except Exception as e:
+                with run.lock:
+                    run.error = run.error or f"{type(e).__name__}: {e}"
+            with run.lock:
+                run.extraction_done = True
+            self.finish(run)
+
+    def finish(self, run: FileRun):
+        """maybe_finish sin interrumpir el hilo: si este falla, los demás hilos quedarían esperando en la cola acotada."""
+        try:
+            self.maybe_finish(run)
+        except Exception:
+            traceback.print_exc(file=sys.stderr)
+
+    def index(self):
+        while True:
+            item = self.batches.get()
+            if item is None:
+                return
+            run, fragments = item
+            try:
+                if run.error is None:
+                    with run.lock:
+                        pairs = hash_fragments(fragments, run.seen)
+                    # Misma indexación por lote que process_and_index_document (casi duplicados enlazados,
+                    # vectores del documento que ya estaban en el índice incluidos en owned)
+                    owned, indexed, near_duplicates, votes = index_new_fragments(
+                        pairs, document_from_job(run.job), run.job["categories"], (run.job["identifier"],)
+                    )
+                    with run.lock:
+                        run.fragments += len(fragments)
+                        run.indexed += indexed
+                        run.near_duplicates += near_duplicates
+                        run.tokens += sum(estimate_tokens(frag) for frag in fragments)
+                        run.owned.update(owned)
+                        run.votes.update(votes)
+            except Exception as e:
+                with run.lock:
+                    run.error = run.error or f"{type(e).__name__}: {e}"
+            with run.lock:
+                run.pending_batches -= 1
+            self.finish(run)
+
+    def maybe_finish(self, run: FileRun):
+        with run.lock:
+            if run.finished or not run.extraction_done or run.pending_batches > 0:
+                return
+            run.finished = True
+
+        job = run.job
+        seconds = time.perf_counter() - run.started
+        category = document_category(run.votes) or "General"
+        try:
+            # Se combina con el manifiesto existente (reintentos, reanudaciones u otro archivo de avance)
+            owned, votes, category = merge_manifest(job["identifier"], run.owned, run.votes)
+            if run.error is None:
+                save_manifest(job["identifier"], owned, document_metadata(document_from_job(job)), category, votes)
+            if run.indexed:
+                bump_index_version()
+        except Exception as e:
+            # El archivo queda con error en el registro de avance (se reintenta al reanudar)
+            run.error = run.error or f"{type(e).__name__}: {e}"
+        entry = {
+            "identifier": job["identifier"],
+            "filePath": job["file_path"],
+            "status": "ok" if run.error is None else "error",
+            "error": run.error,
+            "category": category,
+            "fragments": run.fragments,
+            "indexed": run.indexed,
+            "nearDuplicates": run.near_duplicates,
+            "tokens": run.tokens,
+            "seconds": round(seconds, 3),
+            "fragmentsPerSecond": round(run.fragments / seconds, 2) if seconds else None,
+        }
+        self.checkpoint.record(entry)
+        with self.output_lock:
+            self.totals["docs"] += 1
+            self.totals["failed"] += run.error is not None
+            self.totals["fragments"] += run.fragments
+            self.totals["indexed"] += run.indexed
+            self.totals["tokens"] += run.tokens
+        self.emit({"event": "file", **entry})
+
+    def run(self) -> dict:
+        started = time.perf_counter()
+        for job in self.jobs:
+            self.jobs_queue.put(job)
+
+        # Cada hilo hereda el contexto para acumular las métricas de la ejecución
+        indexers = [threading.Thread(target=contextvars.copy_context().run, args=(self.index,), daemon=True) for _ in range(self.index_workers)]
+        extractors = [threading.Thread(target=contextvars.copy_context().run, args=(self.extract,), daemon=True) for _ in range(self.extract_workers)]
+        for thread in indexers + extractors:
+            thread.start()
+        for thread in extractors:
+            thread.join()
+        for _ in indexers:
+            self.batches.put(None)
+        for thread in indexers:
+            thread.join()
+
+        seconds = time.perf_counter() - started
+        summary = {
+            "event": "summary",
+            **self.totals,
+            "skipped": self.skipped,
+            "seconds": round(seconds, 3),
+            "docsPerSecond": round(self.totals["docs"] / seconds, 3) if seconds else None,
+            "fragmentsPerSecond": round(self.totals["fragments"] / seconds, 2) if seconds else None,
+            "tokensPerSecond": round(self.totals["tokens"] / seconds, 1) if seconds else None,
+            "embeddingCache": get_embedding_cache().stats(),
+            # Llamadas en curso, en espera y limitadas (429) por servicio
+            "schedulers": scheduler_stats(),
+        }
+        metrics = current_metrics()
+        if metrics is not None:
+            summary["metrics"] = metrics.as_dict()
+        self.emit(summary)
+        return summary
+
+
+def document_from_job(job: dict) -> dict:
+    return {
+        "identifier": job["identifier"],
+        "source": job["source_title"],
+        "author": job["author"],
+        "year": job["year"],
+        "minAge": job["minAge"],
+        "maxAge": job["maxAge"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexación masiva de documentos desde un directorio o un manifiesto CSV/JSON.")
+    parser.add_argument("source", help="Directorio con documentos o manifiesto .csv/.json")
+    parser.add_argument("--author", default="")
+    parser.add_argument("--year", default="")
+    parser.add_argument("--min-age", type=int, default=None)
+    parser.add_argument("--max-age", type=int, default=None)
+    parser.add_argument("--categories", default="", help="Categorías separadas por ';'")
+    parser.add_argument("--prefix", default="", help="Prefijo del identificador (p. ej. 'documents/')")
+    parser.add_argument("--checkpoint", default=None, help="Archivo de avance para reanudar (JSON lines)")
+    parser.add_argument("--extract-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--index-workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=8, help="Lotes de fragmentos en espera entre etapas")
+    parser.add_argument("--metrics", action="store_true", help="Incluir métricas por etapa en el resumen")
+    args = parser.parse_args()
+
+    defaults = {
+        "author": args.author,
+        "year": args.year,
+        "minAge": args.min_age,
+        "maxAge": args.max_age,
+        "categories": [c.strip() for c in args.categories.split(";") if c.strip()],
+        "prefix": args.prefix,
+    }
+    checkpoint_path = args.checkpoint or os.path.join(
+        SERVICES_CACHE_DIR, "batch", hashlib.sha1(os.path.abspath(args.source).encode("utf-8")).hexdigest() + ".jsonl"
+    )
+
+    jobs = load_jobs(args.source, defaults)
+    with collect(metrics_requested({"metrics": args.metrics})):
+        summary = BatchIngestion(jobs, Checkpoint(checkpoint_path), args.extract_workers, args.index_workers, args.queue_size).run()
+    sys.exit(1 if summary["failed"] else 0)
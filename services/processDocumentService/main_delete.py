@@ -1,6 +1,7 @@
 import sys
 import json
 from utils import *
+from shared.metrics import collect, metrics_requested
 
 
 def main(identifier: str):
@@ -14,7 +15,11 @@ if __name__ == "__main__":
 
     identifier = sys.argv[1]
     
-    result = main(identifier)
+    # Con SERVICES_METRICS=true se incluyen las métricas de la eliminación
+    with collect(metrics_requested({})) as metrics:
+        result = main(identifier)
+    if metrics is not None:
+        result["metrics"] = metrics.as_dict()
     
     print(json.dumps(result))
     
@@ -0,0 +1,72 @@
+import argparse
+import json
+from utils import *
+from shared.category_centroids import get_category_centroids, sum_by_category
+from shared.vector_store import get_local_index, load_from_pinecone
+
+
+def coerce_ages() -> int:
+    """Convierte a entero las edades guardadas como texto (necesario para el filtro de edad en la consulta)."""
+    if VECTOR_BACKEND == "local":
+        # El índice local ya guarda las edades como enteros
+        return 0
+    index = get_index()
+    updated = 0
+    for ids in index.list(namespace=NAMESPACE):
+        response = index.fetch(ids=list(ids), namespace=NAMESPACE)
+        for vector_id, vector in response.vectors.items():
+            metadata = vector.metadata or {}
+            changes = {
+                field: as_age(metadata[field]) for field in ("minAge", "maxAge")
+                if isinstance(metadata.get(field), str) and metadata[field].strip().isdigit()
+            }
+            if changes:
+                index.update(id=vector_id, set_metadata=changes, namespace=NAMESPACE)
+                updated += 1
+    return updated
+
+
+def rebuild_centroids() -> dict:
+    """Recalcula los centroides por categoría con los fragmentos vigentes (descarta los de documentos eliminados)."""
+    if VECTOR_BACKEND in ("local", "both"):
+        sums = get_local_index().category_sums()
+    else:
+        index = get_index()
+        sums = {}
+        for ids in index.list(namespace=NAMESPACE):
+            response = index.fetch(ids=list(ids), namespace=NAMESPACE)
+            vectors = [
+                {"values": list(vector.values), "metadata": dict(vector.metadata or {})}
+                for vector in response.vectors.values()
+            ]
+            for category, (total, fragments) in sum_by_category(vectors).items():
+                previous = sums.get(category)
+                sums[category] = (total + previous[0], fragments + previous[1]) if previous else (total, fragments)
+    centroids = get_category_centroids()
+    centroids.replace(sums)
+    return centroids.stats()
+
+
+def main(command: str):
+    if command == "sync":
+        # Copia el namespace de Pinecone al índice local (antes de activar VECTOR_BACKEND=local o both)
+        copied = load_from_pinecone(get_pinecone_client().Index(INDEX_NAME, host=PINECONE_HOST), NAMESPACE)
+        bump_index_version()
+        return {"success": True, "copied": copied}
+    if command == "coerce-ages":
+        updated = coerce_ages()
+        bump_index_version()
+        return {"success": True, "updated": updated}
+    if command == "centroids":
+        return {"success": True, **rebuild_centroids()}
+    if command == "compact":
+        return {"success": True, **get_local_index().compact()}
+    return {"success": True, **get_local_index().describe_index_stats()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mantenimiento de los índices vectoriales.")
+    parser.add_argument("command", choices=["sync", "compact", "stats", "coerce-ages", "centroids"])
+    args = parser.parse_args()
+
+    print(json.dumps(main(args.command)))
@@ -0,0 +1,128 @@
+import multiprocessing
+import os
+import sys
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+import fitz
+from PIL import Image, ImageOps
+import pytesseract
+
+load_dotenv()
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from shared.metrics import count, stage, timed
+
+# pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_CMD") or pytesseract.pytesseract.tesseract_cmd
+
+# Procesos dedicados a OCR de páginas sin texto (1 = secuencial); el pool es único por proceso y lo comparten
+# todos los documentos en curso (WORKER_CONCURRENCY), así el total de procesos no depende de cuántos haya
+OCR_WORKERS = int(os.getenv("OCR_WORKERS") or os.cpu_count() or 1)
+# PDF abiertos por cada proceso del pool (los de los documentos en curso)
+WORKER_OPEN_PDFS = 4
+
+# PDF abiertos por cada proceso del pool, del más antiguo al más reciente (ver _ocr_worker_page)
+_worker_pdfs = OrderedDict()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def ocr_pdf_page(page) -> str:
+    """Aplica OCR a una página renderizada directamente en escala de grises invertida."""
+    pix = page.get_pixmap(colorspace=fitz.csGRAY)
+    pix.invert_irect()
+    img = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    return pytesseract.image_to_string(img)
+
+
+@timed("ocr")
+def ocr_image_file(file_path: str) -> str:
+    """Aplica OCR a una imagen (JPG, PNG, etc.) en escala de grises invertida."""
+    img = Image.open(file_path)
+    # Preprocesamiento para OCR
+    img = ImageOps.grayscale(img)
+    img = ImageOps.invert(img)
+    return pytesseract.image_to_string(img)
+
+
+def _ocr_worker_page(file_path: str, page_number: int) -> str:
+    """OCR de una página en un proceso del pool; cada PDF se abre una sola vez por proceso."""
+    pdf = _worker_pdfs.pop(file_path, None) or fitz.open(file_path)
+    _worker_pdfs[file_path] = pdf
+    while len(_worker_pdfs) > WORKER_OPEN_PDFS:
+        _worker_pdfs.popitem(last=False)[1].close()
+    return ocr_pdf_page(pdf[page_number])
+
+
+def _get_pool(workers: int, broken: ProcessPoolExecutor = None) -> ProcessPoolExecutor:
+    """Pool de OCR del proceso (se crea con la primera página escaneada); broken reemplaza un pool que falló.
+
+    Usa "spawn": el indexador tiene otros hilos en ejecución (prefetch, documentos simultáneos) y hacer fork
+    con hilos activos puede dejar bloqueados a los procesos hijos.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool is broken:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _submit(workers: int, file_path: str, page_number: int) -> Future:
+    pool = _get_pool(workers)
+    try:
+        return pool.submit(_ocr_worker_page, file_path, page_number)
+    except BrokenProcessPool:
+        # Un proceso del pool terminó de forma abrupta: se crea otro pool para los documentos siguientes
+        return _get_pool(workers, broken=pool).submit(_ocr_worker_page, file_path, page_number)
+
+
+def _resolve(page_text) -> str:
+    """Texto de una página; si su OCR sigue en curso, el tiempo de espera se reporta en la etapa "ocr"."""
+    if not isinstance(page_text, Future):
+        return page_text
+    with stage("ocr"):
+        return page_text.result()
+
+
+def iter_pdf_pages(file_path: str, workers: int = None):
+    """Genera el texto de cada página en orden; las páginas sin texto pasan por OCR en paralelo.
+
+    Se mantienen como máximo dos páginas en vuelo por proceso, así el consumo de memoria no depende
+    del tamaño del documento y las páginas ya resueltas se entregan sin esperar al resto. El pool de OCR
+    se comparte entre documentos y se crea la primera vez que un documento tiene páginas escaneadas.
+    """
+    workers = workers or OCR_WORKERS
+    with fitz.open(file_path) as pdf:
+        if workers <= 1:
+            for page in pdf:
+                page_text = page.get_text()
+                if not page_text.strip():
+                    count("ocr.pages")
+                    with stage("ocr"):
+                        page_text = ocr_pdf_page(page)
+                yield page_text
+            return
+
+        window = deque()
+        try:
+            for page_number, page in enumerate(pdf):
+                page_text = page.get_text()
+                if not page_text.strip():
+                    page_text = _submit(workers, file_path, page_number)
+                    count("ocr.pages")
+                window.append(page_text)
+
+                while window and (len(window) > 2 * workers or not isinstance(window[0], Future)):
+                    yield _resolve(window.popleft())
+
+            while window:
+                yield _resolve(window.popleft())
+        finally:
+            # Si el documento se abandona (error o generador cerrado) sus páginas pendientes no ocupan el pool
+            for page_text in window:
+                if isinstance(page_text, Future):
+                    page_text.cancel()
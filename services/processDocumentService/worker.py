@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import count
+from main import run
+
+# Documentos procesados simultáneamente por el proceso residente
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY") or 2)
+
+
+class JobWorker:
+    """Proceso residente de indexación: recibe trabajos en líneas JSON y reporta sus eventos en líneas JSON.
+
+    Cada trabajo usa el mismo payload que main.py (más un "jobId" opcional). Por cada trabajo se emiten
+    eventos "accepted", "progress" (tras cada lote) y "result" con la misma respuesta que imprime main.py.
+    """
+
+    def __init__(self, concurrency: int = WORKER_CONCURRENCY):
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.ids = count(1)
+
+    def handle_line(self, line: str, emit):
+        """Interpreta una línea recibida y encola el trabajo correspondiente; devuelve su Future."""
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            emit({"event": "error", "jobId": None, "error": f"JSON inválido: {e}"})
+            return None
+
+        if data.get("op") == "ping":
+            emit({"event": "pong"})
+            return None
+
+        # El jobId del cliente se usa tal cual (también 0); los automáticos llevan prefijo para no coincidir con ellos
+        job_id = data["jobId"] if data.get("jobId") is not None else f"auto-{next(self.ids)}"
+        emit({"event": "accepted", "jobId": job_id})
+        return self.executor.submit(self.run_job, job_id, data, emit)
+
+    def run_job(self, job_id, data: dict, emit):
+        def on_progress(progress: dict):
+            emit({"event": "progress", "jobId": job_id, **progress})
+
+        try:
+            result = run(data, on_progress)
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            result = {"success": False, "error": str(e)}
+        emit({"event": "result", "jobId": job_id, "result": result})
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def line_emitter(stream):
+    """Crea una función que escribe eventos como líneas JSON de forma segura entre hilos."""
+    lock = threading.Lock()
+
+    def emit(event: dict):
+        with lock:
+            try:
+                stream.write(json.dumps(event) + "\n")
+                stream.flush()
+            except (BrokenPipeError, ConnectionError, ValueError):
+                # El cliente se desconectó; el trabajo termina igualmente
+                pass
+
+    return emit
+
+
+def serve_stdin(worker: JobWorker):
+    """Lee trabajos de stdin hasta EOF y espera a que terminen los pendientes."""
+    emit = line_emitter(sys.stdout)
+    for line in sys.stdin:
+        worker.handle_line(line, emit)
+    worker.shutdown()
+
+
+def serve_socket(worker: JobWorker, path: str):
+    """Atiende trabajos en un socket local (Unix); cada conexión recibe los eventos de sus propios trabajos."""
+    if os.path.exists(path):
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+
+    def handle_connection(conn):
+        with conn, conn.makefile("r", encoding="utf-8") as reader, conn.makefile("w", encoding="utf-8") as writer:
+            emit = line_emitter(writer)
+            jobs = [worker.handle_line(line, emit) for line in reader]
+            # El cliente terminó de enviar: se mantiene la conexión hasta reportar todos sus resultados
+            wait([job for job in jobs if job is not None])
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=handle_connection, args=(conn,), daemon=True).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.remove(path)
+        worker.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Proceso residente de indexación de documentos.")
+    parser.add_argument("--socket", help="Ruta del socket Unix a escuchar (por defecto se usa stdin/stdout).")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="Documentos procesados simultáneamente.")
+    args = parser.parse_args()
+
+    worker = JobWorker(args.concurrency)
+    if args.socket:
+        serve_socket(worker, args.socket)
+    else:
+        serve_stdin(worker)
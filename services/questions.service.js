@@ -0,0 +1,185 @@
+import { spawn } from 'child_process'
+import net from 'net'
+import { resolve, dirname } from 'path'
+import { fileURLToPath } from 'url'
+import config from 'config'
+import { Logger } from '../utils/logger.js'
+
+const dirPath = dirname(fileURLToPath(import.meta.url))
+const logger = new Logger({ filename: 'questions-service.log' })
+
+let server = null
+let nextRequestId = 1
+const pendingRequests = new Map()
+
+const getPythonPath = () => resolve(dirPath, `../ciudadano_digital/${config.get('venvPython')}`)
+
+/**
+ * Ejecuta questionsService/main.py en un proceso nuevo (modo original, usado como respaldo).
+ * @param {object} payload - Payload de la pregunta
+ * @param {function} onDelta - Callback opcional con los fragmentos de la respuesta (payload.stream)
+ * @returns {Promise<object>} Respuesta de main.py
+ */
+const runOnce = (payload, onDelta) =>
+  new Promise((resolvePromise, reject) => {
+    const servicePath = resolve(dirPath, './questionsService/main.py')
+    const py = spawn(getPythonPath(), [servicePath])
+
+    py.stdin.write(JSON.stringify(payload))
+    py.stdin.end()
+
+    let stdout = ''
+    let stderr = ''
+    let final = null
+
+    py.stdout.on('data', (data) => {
+      stdout += data
+      if (!payload.stream) return
+      // En streaming cada línea es un evento: los "delta" se entregan apenas llegan y "final" trae la respuesta completa
+      const lines = stdout.split('\n')
+      stdout = lines.pop()
+      for (const line of lines.filter((line) => line.trim())) {
+        // Una línea que no es JSON (p. ej. un aviso de una librería) no debe derribar el proceso de Node
+        let parsed
+        try {
+          parsed = JSON.parse(line)
+        } catch (e) {
+          logger.error(`${line} || ${e.message}`, { title: 'Línea inválida del servicio de preguntas' })
+          continue
+        }
+        const { event, ...data } = parsed
+        if (event === 'delta') onDelta?.(data.text)
+        else if (event === 'final') final = data
+      }
+    })
+    py.stderr.on('data', (data) => (stderr += data))
+    py.on('error', reject)
+
+    py.on('close', (code) => {
+      if (stderr || code !== 0) return reject(new Error(stderr || `Python terminó con error: ${code}`))
+      if (payload.stream) {
+        return final ? resolvePromise(final) : reject(new Error('El servicio Python no envió la respuesta final'))
+      }
+      try {
+        resolvePromise(JSON.parse(stdout))
+      } catch (e) {
+        reject(new Error(`Respuesta inválida del servicio Python: ${stdout} || ${e.message}`))
+      }
+    })
+  })
+
+const handleEvent = (line) => {
+  if (!line.trim()) return
+
+  let event
+  try {
+    event = JSON.parse(line)
+  } catch (e) {
+    logger.error(`${line} || ${e.message}`, { title: 'Evento inválido del servidor de preguntas' })
+    return
+  }
+
+  const request = pendingRequests.get(event.id)
+  if (!request) return
+
+  if (event.event === 'delta') {
+    request.streamed = true
+    request.onDelta?.(event.text)
+  } else if (event.event === 'result') {
+    pendingRequests.delete(event.id)
+    request.resolve(event.result)
+  } else if (event.event === 'error') {
+    pendingRequests.delete(event.id)
+    request.reject(new Error(event.error))
+  }
+}
+
+const onServerLost = (connection, reason) => {
+  if (server !== connection) return
+  server = null
+  logger.error(reason, { title: 'Servidor de preguntas no disponible' })
+  // Las preguntas en curso se resuelven con un proceso propio para no perder la respuesta. Si ya se enviaron
+  // fragmentos al cliente se rechaza: otra generación repetiría (o no continuaría) el texto ya mostrado
+  for (const request of pendingRequests.values()) {
+    if (request.streamed) request.reject(new Error(`${reason} (respuesta en streaming interrumpida)`))
+    else runOnce(request.payload, request.onDelta).then(request.resolve, request.reject)
+  }
+  pendingRequests.clear()
+}
+
+const readLines = (stream, connection) => {
+  let buffer = ''
+  stream.on('data', (data) => {
+    buffer += data.toString()
+    const lines = buffer.split('\n')
+    buffer = lines.pop()
+    lines.forEach(handleEvent)
+  })
+  stream.on('error', (error) => onServerLost(connection, error.message))
+}
+
+/**
+ * Conecta con el servidor residente: por socket si QUESTIONS_SOCKET está configurado,
+ * o iniciando questionsService/server.py y comunicándose por stdin/stdout.
+ */
+const startServer = () => {
+  const socketPath = config.has('questionsSocket') ? config.get('questionsSocket') : null
+  const connection = {}
+
+  if (socketPath) {
+    const socket = net.createConnection(socketPath)
+    connection.input = socket
+    readLines(socket, connection)
+    socket.on('close', () => onServerLost(connection, `Conexión cerrada con ${socketPath}`))
+    return connection
+  }
+
+  const servicePath = resolve(dirPath, './questionsService/server.py')
+  const py = spawn(getPythonPath(), [servicePath], {
+    stdio: ['pipe', 'pipe', 'pipe'],
+    detached: false,
+    env: { ...process.env },
+    shell: false,
+  })
+  connection.input = py.stdin
+  readLines(py.stdout, connection)
+
+  py.stderr.on('data', (data) => {
+    logger.error(data.toString(), { title: 'Python stderr' })
+  })
+  py.stdin.on('error', (error) => onServerLost(connection, error.message))
+  py.on('error', (error) => onServerLost(connection, error.message))
+  py.on('close', (code) => onServerLost(connection, `El servidor de preguntas terminó con código ${code}`))
+
+  return connection
+}
+
+const sendRequest = (payload, onDelta) => {
+  if (!server) server = startServer()
+
+  const id = nextRequestId++
+  return new Promise((resolvePromise, reject) => {
+    pendingRequests.set(id, { resolve: resolvePromise, reject, payload, onDelta })
+    server.input.write(`${JSON.stringify({ ...payload, id })}\n`)
+  })
+}
+
+/**
+ * Obtiene la respuesta a una pregunta desde el servidor residente (clientes y conexiones ya abiertos).
+ * Si el servidor no está disponible, la pregunta se atiende iniciando main.py como antes.
+ * @param {object} payload - Mismo payload que recibe questionsService/main.py
+ * @param {object} options - onDelta: callback opcional con cada fragmento de la respuesta mientras se genera
+ * @returns {Promise<object>} Respuesta de main.py ({ response, reference, category, chatName })
+ */
+export const askQuestion = (payload, { onDelta } = {}) =>
+  sendRequest(onDelta ? { ...payload, stream: true } : payload, onDelta)
+
+/**
+ * Incorpora los mensajes nuevos de un chat a su resumen anterior.
+ * @param {object} params - resumen: resumen guardado; mensajes: mensajes "source-content" aún no resumidos, en orden cronológico
+ * @returns {Promise<string>} Resumen actualizado
+ */
+export const summarizeChat = async ({ resumen, mensajes }) => {
+  const result = await sendRequest({ op: 'summarize', resumen, mensajes })
+  return result.resumen
+}
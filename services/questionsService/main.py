@@ -1,38 +1,55 @@
-import os
-from openai import OpenAI
-from pinecone import Pinecone
-from dotenv import load_dotenv
 import sys
 import json
 from utils import *
+from shared.metrics import collect, metrics_requested, profile_requested, profiled
+from shared.scheduler import scheduler_stats
 
-dotenv_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../.env'))
-load_dotenv(dotenv_path)
 
-EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
-LLM_MODEL = os.getenv("OPENAI_LLM_MODEL", "gpt-4o-mini")
-INDEX_NAME = os.getenv("PINECONE_INDEX", "ciudadano-digital")
-TOP_K = os.getenv("PINECONE_TOP_K", 5)
+def main(question, categories, historial, resumen, chat, edad, on_delta=None):
+    # El nombre del chat se obtiene en paralelo; la categoría se resuelve localmente con el embedding
+    # de la pregunta (el LLM solo clasifica cuando la clasificación local no tiene confianza)
+    chat_name = submit(get_chat_name, question) if chat == "undefined" else None
+    query_emb = embed_query(question)
+    category = classify_query_category(question, categories, query_emb)
 
+    # Solo las preguntas sin historial ni resumen comparten respuesta; los seguimientos siguen siendo personalizados
+    scope = answer_scope(edad, category) if not historial and not resumen else None
+    cached = cached_answer(scope, query_emb) if scope else None
+    if cached:
+        respuesta, referencia = cached["response"], cached["reference"]
+        if on_delta:
+            on_delta(respuesta)
+    else:
+        respuesta, referencias = rag_query(question, category, historial, edad, resumen, query_emb, on_delta)
+        sin_respuesta = is_no_answer(respuesta)
+        referencia = None if sin_respuesta else ";;; ".join(list(dict.fromkeys(referencias)))
+        # Las respuestas sin contexto no se guardan: una falla pasajera de la recuperación no debe repetirse
+        # en las preguntas parecidas, y la siguiente consulta vuelve a buscar en el índice
+        if scope and referencias and not sin_respuesta:
+            store_answer(scope, query_emb, question, respuesta, referencia)
 
-def main(question, categories, historial, resumen, chat, edad):
-    category = classify_query_category(question, categories)
-    chatName = chat if chat != "undefined" else get_chat_name(question)
-    
-    respuesta, referencias, nuevo_resumen = rag_query(question, category, historial, edad, resumen)
+    chatName = chat_name.result() if chat_name else chat
     return {
         "response": respuesta,
-        "reference": None if respuesta == "No puedo responder." else ";;; ".join(list(dict.fromkeys(referencias))),
+        "reference": referencia,
         "question":question,
         "category":category,
-        "chatName":chatName,
-        "resumen":nuevo_resumen
+        "chatName":chatName
         }
 
 
-if __name__ == "__main__":
-    raw = sys.stdin.read()
-    data = json.loads(raw)
+def run(data: dict, on_delta=None) -> dict:
+    """Ejecuta main a partir del payload JSON que envía la API.
+
+    on_delta recibe los fragmentos de la respuesta a medida que se generan (solo si el payload trae "stream": true).
+    Con "op": "summarize" no se responde una pregunta: se incorporan los "mensajes" nuevos al "resumen" anterior.
+    """
+    if data.get("op") == "summarize":
+        with collect(metrics_requested(data)) as metrics:
+            response = {"resumen": get_new_resumen(data.get("resumen"), data.get("mensajes", []))}
+        if metrics is not None:
+            response["metrics"] = metrics.as_dict()
+        return response
 
     question = data.get("question")
     chat = data.get("chat")
@@ -41,5 +58,31 @@ if __name__ == "__main__":
     resumen = data.get("resumen")
     edad = int(data.get("edad"))
 
-    response = main(question, categories, historial, resumen, chat, edad)
-    print(json.dumps(response))
\ No newline at end of file
+    # Métricas por etapa ("metrics": true) y perfil cProfile ("profile": true), opcionales
+    with collect(metrics_requested(data)) as metrics, profiled("questions", profile_requested(data)) as profile_path:
+        response = main(question, categories, historial, resumen, chat, edad, on_delta if data.get("stream") else None)
+    if metrics is not None:
+        response["metrics"] = {
+            **metrics.as_dict(),
+            "embeddingCache": get_embedding_cache().stats(),
+            "answerCache": get_answer_cache().stats(),
+            "classifier": classifier_stats(),
+            "schedulers": scheduler_stats()
+        }
+    if profile_path:
+        response["profile"] = profile_path
+    return response
+
+
+if __name__ == "__main__":
+    raw = sys.stdin.read()
+    data = json.loads(raw)
+
+    if data.get("stream"):
+        # Líneas JSON: un evento "delta" por fragmento de la respuesta y un evento "final" con la respuesta completa
+        def emit_delta(text: str):
+            print(json.dumps({"event": "delta", "text": text}), flush=True)
+
+        print(json.dumps({"event": "final", **run(data, emit_delta)}), flush=True)
+    else:
+        print(json.dumps(run(data)))
\ No newline at end of file
@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from main import run
+from utils import classifier_stats, get_category_centroids, get_embedding_cache, get_index, get_openai_client
+from shared.scheduler import scheduler_stats
+from shared.tokens import get_encoding
+
+# Preguntas atendidas simultáneamente por el proceso residente
+QUESTIONS_CONCURRENCY = int(os.getenv("QUESTIONS_CONCURRENCY") or 16)
+
+
+class Shutdown(Exception):
+    """Se lanza desde el manejador de SIGTERM para salir del bucle de conexiones."""
+
+
+class QuestionServer:
+    """Proceso residente de preguntas: recibe solicitudes en líneas JSON y responde en líneas JSON.
+
+    Cada solicitud usa el mismo payload que main.py más un "id" opcional; la respuesta es
+    {"event": "result", "id", "result"} con la misma salida de main.py, o {"event": "error", "id", "error"}.
+    Con "stream": true, antes del resultado se envían eventos {"event": "delta", "id", "text"} con la respuesta parcial.
+    Las respuestas pueden llegar en otro orden que las solicitudes. {"op": "health"} responde el estado del proceso
+    y {"op": "summarize", "resumen", "mensajes"} actualiza el resumen de un chat (resultado {"resumen"}).
+    Los clientes de OpenAI y Pinecone se crean una vez y sus conexiones se reutilizan entre solicitudes.
+    """
+
+    def __init__(self, concurrency: int = QUESTIONS_CONCURRENCY):
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.inflight = 0
+        self.served = 0
+        self.failed = 0
+        self.closing = False
+
+    def warm_up(self):
+        """Crea los clientes y abre las conexiones antes de la primera pregunta."""
+        get_openai_client()
+        get_embedding_cache()
+        get_category_centroids().load()
+        # Carga el tokenizador usado para ajustar el prompt
+        get_encoding()
+        index = get_index()
+        try:
+            # Una sola llamada directa (sin el planificador ni sus reintentos con backoff) para no demorar el inicio
+            getattr(index, "index", index).describe_index_stats()
+        except Exception:
+            # Sin conexión por ahora: se reintentará con la primera pregunta
+            pass
+
+    def health(self) -> dict:
+        with self.lock:
+            return {
+                "event": "health",
+                "status": "closing" if self.closing else "ok",
+                "uptime": round(time.time() - self.started, 1),
+                "inflight": self.inflight,
+                "served": self.served,
+                "failed": self.failed,
+                "classifier": classifier_stats(),
+                # Llamadas a OpenAI y Pinecone en curso, en espera (profundidad de la cola) y limitadas (429)
+                "schedulers": scheduler_stats(),
+            }
+
+    def handle_line(self, line: str, emit):
+        """Interpreta una línea recibida y encola la pregunta; devuelve su Future."""
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            emit({"event": "error", "id": None, "error": f"JSON inválido: {e}"})
+            return None
+
+        if data.get("op") == "health":
+            emit({**self.health(), "id": data.get("id")})
+            return None
+        if self.closing:
+            emit({"event": "error", "id": data.get("id"), "error": "El servidor se está deteniendo"})
+            return None
+
+        with self.lock:
+            self.inflight += 1
+        return self.executor.submit(self.answer, data.get("id"), data, emit)
+
+    def answer(self, request_id, data: dict, emit):
+        def on_delta(text: str):
+            emit({"event": "delta", "id": request_id, "text": text})
+
+        try:
+            event = {"event": "result", "id": request_id, "result": run(data, on_delta)}
+            failed = False
+        except Exception as e:
+            event = {"event": "error", "id": request_id, "error": f"{type(e).__name__}: {e}"}
+            failed = True
+        with self.lock:
+            self.inflight -= 1
+            self.served += 1
+            self.failed += failed
+        emit(event)
+
+    def shutdown(self):
+        """Deja de aceptar preguntas y espera a que terminen las que están en curso."""
+        with self.lock:
+            self.closing = True
+        self.executor.shutdown(wait=True)
+
+
+def line_emitter(stream):
+    """Crea una función que escribe eventos como líneas JSON de forma segura entre hilos."""
+    lock = threading.Lock()
+
+    def emit(event: dict):
+        with lock:
+            try:
+                stream.write(json.dumps(event) + "\n")
+                stream.flush()
+            except (BrokenPipeError, ConnectionError, ValueError):
+                # El cliente se desconectó; la respuesta se descarta
+                pass
+
+    return emit
+
+
+def serve_stdin(server: QuestionServer):
+    """Lee solicitudes de stdin hasta EOF (o SIGTERM) y espera a que terminen las pendientes."""
+    emit = line_emitter(sys.stdout)
+    try:
+        for line in sys.stdin:
+            server.handle_line(line, emit)
+    except Shutdown:
+        pass
+    finally:
+        server.shutdown()
+
+
+def serve_socket(server: QuestionServer, path: str):
+    """Atiende solicitudes en un socket local (Unix); cada conexión puede enviar varias preguntas a la vez."""
+    if os.path.exists(path):
+        os.remove(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen()
+
+    def handle_connection(conn):
+        with conn, conn.makefile("r", encoding="utf-8") as reader, conn.makefile("w", encoding="utf-8") as writer:
+            emit = line_emitter(writer)
+            jobs = [server.handle_line(line, emit) for line in reader]
+            # El cliente cerró su envío: se mantiene la conexión hasta entregar sus respuestas
+            for job in jobs:
+                if job is not None:
+                    job.result()
+
+    try:
+        while True:
+            conn, _ = listener.accept()
+            threading.Thread(target=handle_connection, args=(conn,), daemon=True).start()
+    except (Shutdown, KeyboardInterrupt):
+        pass
+    finally:
+        listener.close()
+        os.remove(path)
+        server.shutdown()
+
+
+def raise_shutdown(signum, frame):
+    raise Shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Proceso residente de preguntas (RAG).")
+    parser.add_argument("--socket", help="Ruta del socket Unix a escuchar (por defecto se usa stdin/stdout).")
+    parser.add_argument("--concurrency", type=int, default=QUESTIONS_CONCURRENCY, help="Preguntas atendidas simultáneamente.")
+    args = parser.parse_args()
+
+    # SIGTERM: no se aceptan más preguntas y se terminan las que están en curso antes de salir
+    signal.signal(signal.SIGTERM, raise_shutdown)
+
+    server = QuestionServer(args.concurrency)
+    server.warm_up()
+    if args.socket:
+        serve_socket(server, args.socket)
+    else:
+        serve_stdin(server)
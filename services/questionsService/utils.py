@@ -1,23 +1,112 @@
+import contextvars
 import os
-from openai import OpenAI
-from pinecone import Pinecone
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from dotenv import load_dotenv
 
 dotenv_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../.env'))
 load_dotenv(dotenv_path)
 
+# Módulos compartidos entre servicios (services/shared)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from shared.answer_cache import answer_scope, cached_answer, get_answer_cache, store_answer
+from shared.category_centroids import best_categories, category_matrix, get_category_centroids
+from shared.embedding_cache import cached_embeddings, get_embedding_cache
+from shared.metrics import count, record_usage, stage, timed
+from shared.scheduler import RateLimited, ScheduledIndex, get_scheduler
+from shared.tokens import count_tokens, truncate_tokens
+from shared.vector_store import VECTOR_BACKEND, get_local_index
+
 EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
 LLM_MODEL = os.getenv("OPENAI_LLM_MODEL", "gpt-4o-mini")
 INDEX_NAME = os.getenv("PINECONE_INDEX", "ciudadano-digital")
 TOP_K = int(os.getenv("PINECONE_TOP_K", 5))
-SIMILARITY_THRESHOLD = os.getenv("SIMILARITY_THRESHOLD", 0.35)
+# Host del índice (p. ej. el servidor local de los benchmarks); vacío = se resuelve por nombre
+PINECONE_HOST = os.getenv("PINECONE_HOST", "")
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD") or 0.35)
+# Candidatos pedidos por cada fragmento útil (permite priorizar la categoría y completar con otras en una consulta)
+RETRIEVAL_OVERFETCH = int(os.getenv("RETRIEVAL_OVERFETCH") or 3)
+# server: el filtro de edad va en la consulta; local: solo se aplica sobre los resultados
+RETRIEVAL_AGE_FILTER = (os.getenv("RETRIEVAL_AGE_FILTER") or "server").lower()
+# Hilos para las llamadas independientes de cada pregunta (nombre del chat, embedding)
+FANOUT_WORKERS = int(os.getenv("QUESTIONS_FANOUT_WORKERS") or 32)
+# Clasificación de preguntas: local (embedding de la pregunta contra los centroides de cada categoría) o llm
+QUERY_CLASSIFIER = (os.getenv("QUERY_CLASSIFIER") or "local").lower()
+# Se recurre al LLM si la mejor categoría no alcanza CLASSIFIER_MIN_SCORE o no supera a la segunda por CLASSIFIER_MARGIN
+CLASSIFIER_MIN_SCORE = float(os.getenv("CLASSIFIER_MIN_SCORE") or 0.25)
+CLASSIFIER_MARGIN = float(os.getenv("CLASSIFIER_MARGIN") or 0.02)
+# Límite de tokens del prompt de respuesta y, dentro de él, del resumen y del historial
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET") or 3000)
+PROMPT_SUMMARY_TOKENS = int(os.getenv("PROMPT_SUMMARY_TOKENS") or 300)
+PROMPT_HISTORY_TOKENS = int(os.getenv("PROMPT_HISTORY_TOKENS") or 600)
+# Proporción de texto compartido a partir de la cual un fragmento se considera repetido
+PROMPT_DEDUP_THRESHOLD = float(os.getenv("PROMPT_DEDUP_THRESHOLD") or 0.8)
+
+
+# CLIENTES (se importan y crean en el primer uso y se reutilizan)
+# Las llamadas pasan por los planificadores de shared/scheduler.py, que limitan el ritmo y hacen los reintentos
+@lru_cache(maxsize=None)
+def get_openai_client():
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+
+@lru_cache(maxsize=None)
+def get_index():
+    # Con VECTOR_BACKEND=local o both las preguntas se resuelven con el índice local, sin ir a la red
+    if VECTOR_BACKEND in ("local", "both"):
+        return get_local_index()
+    from pinecone import Pinecone
+    return ScheduledIndex(Pinecone(api_key=os.getenv("PINECONE_API_KEY")).Index(INDEX_NAME, host=PINECONE_HOST), get_scheduler("pinecone"))
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(max_workers=FANOUT_WORKERS)
+
+
+def submit(func, *args):
+    """Ejecuta func en segundo plano (con el contexto actual, p. ej. las métricas) y devuelve su Future."""
+    return get_executor().submit(contextvars.copy_context().run, func, *args)
+
+
+# Preguntas clasificadas localmente y con el LLM desde que inició el proceso
+_classifier_counts = {"local": 0, "fallback": 0}
+_classifier_lock = threading.Lock()
+
+
+def classify_locally(query_emb: list, categories: list):
+    """Elige la categoría más similar a la pregunta, o None si la diferencia con la segunda no da confianza."""
+    names, matrix = category_matrix(categories, EMBEDDING_MODEL, embed_texts)
+    if not names:
+        return None
+    best, scores, margins = best_categories(matrix, query_emb)
+    if scores[0] < CLASSIFIER_MIN_SCORE or margins[0] < CLASSIFIER_MARGIN:
+        return None
+    return names[int(best[0])]
+
 
-openaiClient = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-pineconeClient = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pineconeClient.Index(INDEX_NAME)
+def classifier_stats() -> dict:
+    with _classifier_lock:
+        local, fallback = _classifier_counts["local"], _classifier_counts["fallback"]
+    total = local + fallback
+    return {"local": local, "fallback": fallback, "fallbackRate": round(fallback / total, 4) if total else None}
 
 
-def classify_query_category(query: str, categories=list) -> str:
+def classify_query_category(query: str, categories=list, query_emb: list=None) -> str:
+    """Categoría de la pregunta: con su embedding se intenta primero la clasificación local (sin red)."""
+    if query_emb is not None and QUERY_CLASSIFIER == "local":
+        with stage("classify"):
+            category = classify_locally(query_emb, categories)
+        outcome = "local" if category else "fallback"
+        with _classifier_lock:
+            _classifier_counts[outcome] += 1
+        count(f"classifier.{outcome}")
+        if category:
+            return category
+
     prompt = f"""
     Clasifica la siguiente pregunta en una de estas categorías:
     {categories}
@@ -27,66 +116,102 @@ def classify_query_category(query: str, categories=list) -> str:
     Pregunta: {query}
     """
     try:
-        response = openaiClient.chat.completions.create(
-            model=LLM_MODEL,
-            messages=[{"role": "user", "content": prompt}]
-        )
+        with stage("classify"):
+            response = get_scheduler("openai").call(
+                get_openai_client().chat.completions.create,
+                model=LLM_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                tokens=count_tokens(prompt)
+            )
+        record_usage("openai.chat", response)
         return response.choices[0].message.content.strip()
+    except RateLimited:
+        # Sin cuota la pregunta falla en lugar de responderse sin categoría
+        raise
     except Exception:
         return None
 
 
-def retrieve_context(query: str, category_filter: str=None, top_k: int=TOP_K, edad:int=None):
-    """Recupera fragmentos relevantes desde Pinecone para RAG."""
-    query_emb = openaiClient.embeddings.create(
+@timed("embed")
+def embed_texts(texts: list) -> list:
+    response = get_scheduler("openai").call(
+        get_openai_client().embeddings.create,
         model=EMBEDDING_MODEL,
-        input=query
-    ).data[0].embedding
+        input=texts,
+        tokens=sum(count_tokens(text) for text in texts)
+    )
+    record_usage("openai.embeddings", response)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
 
-    filter_obj = {"category": {"$eq": category_filter}} if category_filter else None
 
-    results = index.query(
-        vector=query_emb,
-        top_k=top_k,
-        include_metadata=True,
-        filter=filter_obj,
-        namespace="ciudadania"
-    )
-    
-    if not results.matches and category_filter:
-        results = index.query(
+def embed_query(query: str) -> list:
+    """Embedding de la pregunta, reutilizando la caché compartida (preguntas repetidas no llaman a la API)."""
+    return cached_embeddings(EMBEDDING_MODEL, [query], embed_texts)[0]
+
+
+# Edad máxima representable en las edades guardadas como texto (ver age_filter)
+LEGACY_MAX_AGE = 120
+
+
+def age_filter(edad: int) -> dict:
+    """Filtro de Pinecone: fragmentos cuyo rango de edad incluye edad (un límite ausente no restringe).
+
+    Los vectores indexados antes de convertir las edades las guardan como texto ("12"), que $lte/$gte no
+    comparan: para ellos se enumeran los valores válidos con $in ("" equivale a un límite ausente), así el
+    contenido sin migrar (main_vectors.py coerce-ages) sigue apareciendo.
+    """
+    edad = int(edad)
+    younger = [str(age) for age in range(0, min(edad, LEGACY_MAX_AGE) + 1)]
+    older = [str(age) for age in range(max(edad, 0), LEGACY_MAX_AGE + 1)]
+    return {"$and": [
+        {"$or": [{"minAge": {"$lte": edad}}, {"minAge": {"$in": younger + [""]}}, {"minAge": {"$exists": False}}]},
+        {"$or": [{"maxAge": {"$gte": edad}}, {"maxAge": {"$in": older + [""]}}, {"maxAge": {"$exists": False}}]},
+    ]}
+
+
+def age_eligible(meta: dict, edad: int) -> bool:
+    """Misma regla que age_filter, evaluada sobre los metadatos (también acepta edades guardadas como texto)."""
+    min_age = meta.get("minAge")
+    max_age = meta.get("maxAge")
+    try:
+        min_age = int(min_age) if min_age is not None else None
+        max_age = int(max_age) if max_age is not None else None
+    except (ValueError, TypeError):
+        return True
+    return (min_age is None or min_age <= edad) and (max_age is None or edad <= max_age)
+
+
+def retrieve_context(query: str, category_filter: str=None, top_k: int=TOP_K, edad:int=None, query_emb: list=None):
+    """Recupera fragmentos relevantes para RAG en una sola consulta (query_emb: embedding ya calculado de la pregunta).
+
+    La edad se filtra en el índice y se piden top_k * RETRIEVAL_OVERFETCH candidatos de todas las categorías:
+    primero se toman los de category_filter y, si no alcanzan, se completa con los de otras categorías.
+    """
+    query_emb = query_emb or embed_query(query)
+
+    filter_obj = age_filter(edad) if edad is not None and RETRIEVAL_AGE_FILTER == "server" else None
+    with stage("query"):
+        results = get_index().query(
             vector=query_emb,
-            top_k=top_k,
+            top_k=top_k * RETRIEVAL_OVERFETCH,
             include_metadata=True,
+            filter=filter_obj,
             namespace="ciudadania"
         )
-        
-    if not results.matches or all(float(m["score"]) < float(SIMILARITY_THRESHOLD) for m in results.matches):
-        return [[], []]
+    count("pinecone.query.requests")
+
+    eligible = [
+        match for match in results.get("matches", [])
+        if float(match["score"]) >= SIMILARITY_THRESHOLD and (edad is None or age_eligible(match["metadata"], edad))
+    ]
+    preferred = [match for match in eligible if category_filter and match["metadata"].get("category") == category_filter]
+    others = [match for match in eligible if not (category_filter and match["metadata"].get("category") == category_filter)]
 
     context_fragments = []
     sources = []
-    for match in results.get("matches", []):
+    for match in (preferred + others)[:top_k]:
         meta = match["metadata"]
         
-        min_age = meta.get("minAge")
-        max_age = meta.get("maxAge")
-        if edad is not None:
-            try:
-                min_age = int(min_age) if min_age is not None else None
-                max_age = int(max_age) if max_age is not None else None
-            except (ValueError, TypeError):
-                min_age = max_age = None
-
-            if min_age is not None and max_age is not None:
-                if not (min_age <= edad <= max_age):
-                    continue
-
-            elif min_age is not None and edad < min_age:
-                continue
-            elif max_age is not None and edad > max_age:
-                continue
-        
         fragment_text = meta.get("text", "")
         source = meta.get("source", "Desconocido")
         year = meta.get("year", "")
@@ -109,10 +234,16 @@ def retrieve_context(query: str, category_filter: str=None, top_k: int=TOP_K, ed
     return [context_fragments, sources]
 
 
-def build_rag_prompt(question: str, context_fragments: list, historial:list, resumen:str, edad:int):
-    """Construye el prompt combinando contexto y pregunta."""
-    context_text = "\n\n".join(context_fragments)
-    prompt = f"""
+# Respuesta que el prompt exige cuando el contexto está vacío o no se relaciona con la pregunta
+NO_ANSWER = "No puedo responder."
+
+
+def is_no_answer(answer: str) -> bool:
+    """Indica si la respuesta es NO_ANSWER (el modelo a veces la entrega entre comillas o sin el punto final)."""
+    return answer.strip().strip('"“”\'').strip().rstrip(".").lower() == NO_ANSWER.rstrip(".").lower()
+
+
+RAG_PROMPT_TEMPLATE = """
 Eres un asistente educativo que utiliza el método socrático para guiar a un estudiante de {edad} años.
 
 Puedes razonar y guiar únicamente a partir de los conceptos presentes en el contexto,
@@ -134,16 +265,16 @@ Está prohibido inferir o inventar información no explícitamente presente.
 ---
 
 HISTORIAL:
-{historial if (len(context_text)> 0) else "VACÍO"}
+{historial}
 
 RESUMEN:
-{resumen if (len(context_text)> 0) else "VACÍO"}
+{resumen}
 
 CONTEXTO:
-{context_text if len(context_text) > 0 else "VACÍO"}
+{contexto}
 
 PREGUNTA:
-{question}
+{pregunta}
 
 ---
 
@@ -156,17 +287,157 @@ Idioma: español.
 IMPORTANTE: Adapta tu redacción para responder a una persona de {edad} años.
 """
 
-    return prompt
+# Roles con que la API guarda los mensajes del historial ("user-texto", "assistant-texto")
+HISTORY_ROLES = {"user": "Estudiante", "assistant": "Asistente"}
+
+
+def fragment_shingles(text: str, size: int = 5) -> set:
+    words = text.lower().split()
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def dedupe_fragments(context_fragments: list, threshold: float = PROMPT_DEDUP_THRESHOLD) -> list:
+    """Índices de los fragmentos a conservar: se descarta el que repite (en la proporción threshold de sus
+    secuencias de 5 palabras) a otro mejor ubicado, como los solapes entre fragmentos vecinos o documentos repetidos."""
+    kept = []
+    seen = []
+    for i, fragment in enumerate(context_fragments):
+        shingles = fragment_shingles(fragment)
+        if any(len(shingles & other) / min(len(shingles), len(other)) >= threshold for other in seen):
+            continue
+        kept.append(i)
+        seen.append(shingles)
+    return kept
+
+
+def render_history(historial: list) -> list:
+    """Convierte mensajes "rol-texto" (el historial llega del más reciente al más antiguo) en líneas "Rol: texto" en el mismo orden."""
+    lines = []
+    for message in historial:
+        role, sep, text = str(message).partition("-")
+        if sep and role in HISTORY_ROLES:
+            lines.append(f"{HISTORY_ROLES[role]}: {' '.join(text.split())}")
+        else:
+            lines.append(" ".join(str(message).split()))
+    return lines
+
+
+def fit_history(lines: list, budget: int) -> list:
+    """Conserva los turnos más recientes que caben en budget tokens (recortando el último si no cabe ninguno)."""
+    kept = []
+    used = 0
+    for line in lines:
+        tokens = count_tokens(line) + 1
+        if used + tokens > budget:
+            if not kept:
+                kept.append(truncate_tokens(line, budget - 1))
+            break
+        kept.append(line)
+        used += tokens
+    return kept
+
+
+def build_rag_prompt(question: str, context_fragments: list, historial:list, resumen:str, edad:int):
+    """Construye el prompt combinando contexto y pregunta dentro de PROMPT_TOKEN_BUDGET tokens.
+
+    context_fragments llega ordenado por relevancia: se quitan los repetidos y, si el contexto no cabe, primero
+    los últimos. El resumen y los turnos más recientes del historial tienen su propio límite de tokens.
+    Devuelve [prompt, índices de los fragmentos incluidos].
+    """
+    with stage("prompt"):
+        candidates = dedupe_fragments(context_fragments)
+        count("prompt.fragmentsDeduplicated", len(context_fragments) - len(candidates))
+
+        base_tokens = count_tokens(RAG_PROMPT_TEMPLATE.format(edad=edad, historial="", resumen="", contexto="", pregunta=question))
+        summary = truncate_tokens(" ".join((resumen or "").split()), PROMPT_SUMMARY_TOKENS)
+        history = fit_history(render_history(historial or []), PROMPT_HISTORY_TOKENS)
+        count("prompt.historyTurnsDropped", len(historial or []) - len(history))
+        available = PROMPT_TOKEN_BUDGET - base_tokens - count_tokens(summary) - sum(count_tokens(line) + 1 for line in history)
+
+        # El fragmento más relevante tiene prioridad sobre los turnos más antiguos del historial
+        if candidates:
+            best = count_tokens(context_fragments[candidates[0]]) + 2
+            while history and available < best:
+                available += count_tokens(history.pop()) + 1
+                count("prompt.historyTurnsDropped")
+
+        kept = []
+        parts = []
+        for i in candidates:
+            fragment = context_fragments[i]
+            tokens = count_tokens(fragment) + 2
+            if tokens > available:
+                if kept:
+                    break
+                fragment = truncate_tokens(fragment, available - 2)
+                if not fragment:
+                    break
+                tokens = available
+            kept.append(i)
+            parts.append(fragment)
+            available -= tokens
+        count("prompt.fragmentsDropped", len(candidates) - len(kept))
+
+        has_context = len(parts) > 0
+        prompt = RAG_PROMPT_TEMPLATE.format(
+            edad=edad,
+            # El historial va en orden cronológico
+            historial="\n".join(reversed(history)) if has_context and history else "VACÍO",
+            resumen=summary if has_context and summary else "VACÍO",
+            contexto="\n\n".join(parts) if has_context else "VACÍO",
+            pregunta=question
+        )
+        count("prompt.tokens", count_tokens(prompt))
+    return [prompt, kept]
+
+
+def ask_llm(prompt: str, on_delta=None):
+    """Envía el prompt al LLM y devuelve la respuesta.
 
+    Con on_delta la respuesta se pide en modo streaming y cada fragmento de texto se entrega al llegar.
+    """
+    scheduler = get_scheduler("openai")
+    if on_delta is None:
+        response = scheduler.call(
+            get_openai_client().chat.completions.create,
+            model=LLM_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.2,
+            tokens=count_tokens(prompt)
+        )
+        record_usage("openai.chat", response)
+        return response.choices[0].message.content.strip()
 
-def ask_llm(prompt: str):
-    """Envía el prompt al LLM y devuelve la respuesta."""
-    response = openaiClient.chat.completions.create(
+    # El planificador reintenta hasta que empieza la respuesta y conserva el lugar hasta que termina de llegar
+    with scheduler.stream(
+        get_openai_client().chat.completions.create,
         model=LLM_MODEL,
         messages=[{"role": "user", "content": prompt}],
-        temperature=0.2
-    )
-    return response.choices[0].message.content.strip()
+        temperature=0.2,
+        stream=True,
+        stream_options={"include_usage": True},
+        tokens=count_tokens(prompt)
+    ) as stream:
+        parts = []
+        for chunk in stream:
+            if chunk.usage:
+                # El último fragmento no trae texto, solo el uso de tokens
+                record_usage("openai.chat", chunk)
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if not text:
+                continue
+            if not parts:
+                # La respuesta completa se entrega sin espacios iniciales; los fragmentos también
+                text = text.lstrip()
+                if not text:
+                    continue
+            parts.append(text)
+            on_delta(text)
+    return "".join(parts).strip()
 
 
 def get_chat_name(question:str):
@@ -178,23 +449,36 @@ def get_chat_name(question:str):
     Responde SOLO el nombre.
     """
     try:
-        return ask_llm(prompt)
+        with stage("chatName"):
+            return ask_llm(prompt)
     except Exception:
         return "Nuevo Chat"
 
 
-def get_new_resumen(historial:list):
-    prompt = f"""Resume de forma compacta los siguientes mensajes: 
-    {historial}"""
-    return ask_llm(prompt)
+def get_new_resumen(resumen: str, mensajes: list):
+    """Incorpora al resumen anterior solo los mensajes que todavía no resume ("rol-texto", en orden cronológico)."""
+    nuevos = "\n".join(render_history(mensajes))
+    prompt = f"""Actualiza el resumen de una conversación con los mensajes nuevos.
+    Conserva del resumen anterior lo que siga siendo relevante, incorpora lo nuevo y responde SOLO con el resumen actualizado, de forma compacta.
 
+    Resumen anterior:
+    {resumen or "VACÍO"}
 
-def rag_query(question: str, category: str=None, historial: list=[], edad: int=13, resumen: str=None):
-    """Pipeline completo RAG: recuperar contexto, generar prompt, obtener respuesta."""
-    context_fragments, sources = retrieve_context(question, category_filter=category,edad=edad)
-    
-    new_resumen = get_new_resumen(historial) if len(historial) >= 5 else None
+    Mensajes nuevos:
+    {nuevos}"""
+    with stage("summary"):
+        return ask_llm(prompt)
+
+
+def rag_query(question: str, category: str=None, historial: list=[], edad: int=13, resumen: str=None, query_emb: list=None, on_delta=None):
+    """Pipeline completo RAG: recuperar contexto, generar prompt, obtener respuesta (en streaming si se indica on_delta).
+
+    El resumen de la conversación no se actualiza aquí: la API lo pide aparte ("op": "summarize") después de responder.
+    """
+    context_fragments, sources = retrieve_context(question, category_filter=category, edad=edad, query_emb=query_emb)
     
-    prompt = build_rag_prompt(question, context_fragments, historial, resumen, edad)
-    answer = ask_llm(prompt)
-    return [answer, sources, new_resumen]
+    prompt, kept = build_rag_prompt(question, context_fragments, historial, resumen, edad)
+    sources = [sources[i] for i in kept]
+    with stage("llm"):
+        answer = ask_llm(prompt, on_delta)
+    return [answer, sources]
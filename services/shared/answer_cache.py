@@ -0,0 +1,160 @@
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from shared.index_version import SERVICES_CACHE_DIR, get_index_version
+from shared.metrics import count, stage
+
+# Caché semántica de respuestas a preguntas sin historial (questionsService)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "true").lower() == "true"
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH") or os.path.join(SERVICES_CACHE_DIR, "answers.sqlite3")
+# Similitud coseno mínima entre preguntas para reutilizar la respuesta
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD") or 0.95)
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL") or 7 * 24 * 3600)
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES") or 5000)
+# Límites inferiores de cada franja de edad (una respuesta solo se reutiliza dentro de la misma franja)
+ANSWER_CACHE_AGE_BANDS = [int(age) for age in (os.getenv("ANSWER_CACHE_AGE_BANDS") or "10,13,16,18").split(",") if age.strip()]
+
+
+def answer_scope(edad: int, category: str) -> str:
+    """Ámbito de una respuesta: franja de edad y categoría resuelta de la pregunta."""
+    return f"{bisect_right(ANSWER_CACHE_AGE_BANDS, edad or 0)}|{category or ''}"
+
+
+class AnswerCache:
+    """Respuestas indexadas por el embedding de la pregunta, con búsqueda por similitud coseno dentro de un ámbito.
+
+    Las entradas caducan por TTL, se expulsan por LRU al superar el límite y se descartan cuando cambia
+    la versión del índice (documentos indexados o eliminados). Comparte archivo entre procesos (SQLite WAL).
+    """
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 ttl: int = ANSWER_CACHE_TTL, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY,
+                scope TEXT NOT NULL,
+                index_version TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                question TEXT NOT NULL,
+                response TEXT NOT NULL,
+                reference TEXT,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_scope ON answers (scope, index_version)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_last_used ON answers (last_used)")
+
+    def lookup(self, scope: str, query_emb: list):
+        """Devuelve {"response", "reference", "similarity"} de la pregunta más parecida del ámbito, o None."""
+        import numpy as np
+
+        now = time.time()
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, vector, response, reference FROM answers WHERE scope = ? AND index_version = ? AND created_at >= ?",
+                (scope, get_index_version(), now - self.ttl)
+            ).fetchall()
+        if not rows:
+            self.misses += 1
+            return None
+
+        matrix = np.stack([np.frombuffer(vector, dtype=np.float32) for _, vector, _, _ in rows])
+        query = np.asarray(query_emb, dtype=np.float32)
+        similarities = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            self.misses += 1
+            return None
+
+        entry_id, _, response, reference = rows[best]
+        with self.lock:
+            self.conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, entry_id))
+        self.hits += 1
+        return {"response": response, "reference": reference, "similarity": round(float(similarities[best]), 4)}
+
+    def store(self, scope: str, query_emb: list, question: str, response: str, reference: str):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.execute(
+                "INSERT INTO answers (scope, index_version, vector, question, response, reference, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (scope, get_index_version(), array("f", query_emb).tobytes(), question, response, reference, now, now)
+            )
+            self.conn.execute("COMMIT")
+            self._evict(now)
+
+    def _evict(self, now: float):
+        # Entradas caducadas o de versiones anteriores del índice, y luego las menos usadas por encima del límite
+        self.conn.execute(
+            "DELETE FROM answers WHERE created_at < ? OR index_version != ?",
+            (now - self.ttl, get_index_version())
+        )
+        entries = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        if entries > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_used LIMIT ?)",
+                (entries - int(self.max_entries * 0.9),)
+            )
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hitRate": round(self.hits / total, 4) if total else None}
+
+
+class _DisabledCache:
+    """Sustituto sin efecto cuando ANSWER_CACHE=false."""
+
+    hits = 0
+    misses = 0
+
+    def lookup(self, scope: str, query_emb: list):
+        return None
+
+    def store(self, scope: str, query_emb: list, question: str, response: str, reference: str):
+        pass
+
+    def stats(self) -> dict:
+        return {"hits": 0, "misses": 0, "hitRate": None}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Caché de respuestas del proceso (se abre en el primer uso)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache() if ANSWER_CACHE_ENABLED else _DisabledCache()
+        return _cache
+
+
+def cached_answer(scope: str, query_emb: list):
+    """Busca una respuesta reutilizable y registra el resultado en las métricas de la solicitud."""
+    with stage("answerCache"):
+        cached = get_answer_cache().lookup(scope, query_emb)
+    count("answerCache.hits" if cached else "answerCache.misses")
+    return cached
+
+
+def store_answer(scope: str, query_emb: list, question: str, response: str, reference: str):
+    with stage("answerCache"):
+        get_answer_cache().store(scope, query_emb, question, response, reference)
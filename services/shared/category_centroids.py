@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+from shared.embedding_cache import cached_embeddings
+from shared.index_version import SERVICES_CACHE_DIR
+
+# Centroides de los fragmentos indexados por categoría (suma de embeddings normalizados y cantidad).
+# processDocumentService los actualiza al indexar; ambos servicios los usan para clasificar fragmentos y preguntas sin el LLM.
+CATEGORY_CENTROIDS_PATH = os.getenv("CATEGORY_CENTROIDS_PATH") or os.path.join(SERVICES_CACHE_DIR, "category_centroids.sqlite3")
+
+
+def sum_by_category(vectors: list) -> dict:
+    """Agrupa vectores ({"values", "metadata": {"category"}}) en {categoría: (suma normalizada, cantidad)}."""
+    import numpy as np
+
+    groups = {}
+    for vector in vectors:
+        category = (vector.get("metadata") or {}).get("category")
+        if category:
+            groups.setdefault(category, []).append(vector["values"])
+    sums = {}
+    for category, values in groups.items():
+        matrix = np.asarray(values, dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+        sums[category] = (matrix.sum(axis=0), len(values))
+    return sums
+
+
+class CategoryCentroids:
+    """Suma acumulada de embeddings por categoría en SQLite (WAL), compartida entre procesos.
+
+    Los fragmentos eliminados no se descuentan (no se conocen sus embeddings al eliminar): el centroide
+    de una categoría es un promedio de muchos fragmentos y se recalcula con main_vectors.py centroids.
+    """
+
+    def __init__(self, path: str = CATEGORY_CENTROIDS_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.loaded_version = None
+        self.loaded = {}
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS centroids (category TEXT PRIMARY KEY, total BLOB NOT NULL, count INTEGER NOT NULL)")
+
+    def add(self, vectors: list):
+        """Suma los vectores recién indexados a los centroides de sus categorías."""
+        import numpy as np
+
+        sums = sum_by_category(vectors)
+        if not sums:
+            return
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for category, (total, count) in sums.items():
+                    row = self.conn.execute("SELECT total, count FROM centroids WHERE category = ?", (category,)).fetchone()
+                    if row:
+                        total = total + np.frombuffer(row[0], dtype=np.float32)
+                        count += row[1]
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO centroids (category, total, count) VALUES (?, ?, ?)",
+                        (category, total.astype(np.float32).tobytes(), count)
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.loaded_version = None
+
+    def replace(self, sums: dict):
+        """Reemplaza todos los centroides ({categoría: (suma, cantidad)}), p. ej. al recalcularlos desde el índice."""
+        import numpy as np
+
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("DELETE FROM centroids")
+                self.conn.executemany(
+                    "INSERT INTO centroids (category, total, count) VALUES (?, ?, ?)",
+                    [(category, np.asarray(total, dtype=np.float32).tobytes(), count) for category, (total, count) in sums.items() if count]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.loaded_version = None
+
+    def load(self) -> dict:
+        """{categoría: centroide normalizado}; se relee solo si otro proceso (o este) cambió los centroides."""
+        import numpy as np
+
+        with self.lock:
+            # data_version cambia cuando otra conexión confirma cambios en el archivo
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if version != self.loaded_version:
+                loaded = {}
+                for category, total, _ in self.conn.execute("SELECT category, total, count FROM centroids"):
+                    vector = np.frombuffer(total, dtype=np.float32)
+                    loaded[category] = vector / (np.linalg.norm(vector) + 1e-12)
+                self.loaded = loaded
+                self.loaded_version = version
+            return self.loaded
+
+    def stats(self) -> dict:
+        with self.lock:
+            rows = self.conn.execute("SELECT category, count FROM centroids ORDER BY category").fetchall()
+        return {"categories": len(rows), "fragments": dict(rows)}
+
+
+_centroids = None
+_centroids_lock = threading.Lock()
+
+
+def get_category_centroids() -> CategoryCentroids:
+    """Centroides del proceso (se abren en el primer uso)."""
+    global _centroids
+    with _centroids_lock:
+        if _centroids is None:
+            _centroids = CategoryCentroids()
+        return _centroids
+
+
+@lru_cache(maxsize=32)
+def name_embeddings(model: str, names: tuple, embed):
+    """Embeddings normalizados de los nombres de las categorías (en la caché compartida tras el primer uso)."""
+    import numpy as np
+
+    matrix = np.asarray(cached_embeddings(model, list(names), embed), dtype=np.float32)
+    return matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12)
+
+
+def category_matrix(categories: list, model: str, embed):
+    """Un vector normalizado por categoría: el embedding de su nombre más el centroide de sus fragmentos, si los tiene.
+
+    Incluye las categorías recibidas y las que ya tienen fragmentos indexados; devuelve (nombres, matriz) o ([], None).
+    """
+    import numpy as np
+
+    centroids = get_category_centroids().load()
+    names = sorted(set(categories or []) | set(centroids))
+    if not names:
+        return [], None
+    matrix = name_embeddings(model, tuple(names), embed).copy()
+    for i, name in enumerate(names):
+        if name in centroids:
+            matrix[i] += centroids[name]
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+    return names, matrix
+
+
+def best_categories(matrix, vectors):
+    """Para cada vector: índice de la categoría más similar, su similitud coseno y su ventaja sobre la segunda."""
+    import numpy as np
+
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, matrix.shape[1])
+    scores = (vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)) @ matrix.T
+    if scores.shape[1] == 1:
+        return np.zeros(len(scores), dtype=np.int64), scores[:, 0], np.full(len(scores), np.inf)
+    top = np.argpartition(-scores, 1, axis=1)[:, :2]
+    first = np.take_along_axis(scores, top, axis=1)
+    # argpartition no ordena los dos primeros entre sí
+    swap = first[:, 1] > first[:, 0]
+    best = np.where(swap, top[:, 1], top[:, 0])
+    best_scores = np.where(swap, first[:, 1], first[:, 0])
+    margins = np.abs(first[:, 0] - first[:, 1])
+    return best, best_scores, margins
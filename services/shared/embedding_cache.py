@@ -0,0 +1,158 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from shared.metrics import count, stage
+
+# Caché de embeddings en disco compartida por processDocumentService y questionsService
+SERVICES_CACHE_DIR = os.getenv("SERVICES_CACHE_DIR") or os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".cache"))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH") or os.path.join(SERVICES_CACHE_DIR, "embeddings.sqlite3")
+# Cada entrada de 1536 dimensiones ocupa ~6 KB
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 50000))
+
+# SQLite limita la cantidad de parámetros por consulta
+_QUERY_CHUNK = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Caché persistente de embeddings (float32) con clave (modelo, sha1(texto)) y expulsión LRU por tamaño.
+
+    Usa SQLite en modo WAL, por lo que varios procesos (CLI, proceso residente) pueden compartir el archivo.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self.entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, texts: list) -> list:
+        """Devuelve una lista alineada con texts: el vector en caché o None."""
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        with self.lock:
+            for start in range(0, len(hashes), _QUERY_CHUNK):
+                chunk = list(set(hashes[start:start + _QUERY_CHUNK]))
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *chunk]
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found]
+                )
+
+        vectors = []
+        for h in hashes:
+            blob = found.get(h)
+            vectors.append(array("f", blob).tolist() if blob is not None else None)
+        hits = sum(vector is not None for vector in vectors)
+        self.hits += hits
+        self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, model: str, texts: list, vectors: list):
+        """Guarda los vectores de texts y expulsa las entradas menos usadas si se supera el límite."""
+        now = time.time()
+        rows = [(model, text_hash(text), array("f", vector).tobytes(), now) for text, vector in zip(texts, vectors)]
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self.conn.execute("COMMIT")
+            self.entries += len(rows)
+            if self.entries > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        # Se recuenta (otros procesos pueden haber escrito) y se deja un 10% de margen para no expulsar en cada escritura
+        self.entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self.entries - int(self.max_entries * 0.9)
+        if self.entries > self.max_entries and excess > 0:
+            self.conn.execute(
+                "DELETE FROM embeddings WHERE (model, text_hash) IN "
+                "(SELECT model, text_hash FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+            self.entries -= excess
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hitRate": round(self.hits / total, 4) if total else None}
+
+
+class _DisabledCache:
+    """Sustituto sin efecto cuando EMBEDDING_CACHE=false."""
+
+    hits = 0
+    misses = 0
+
+    def get_many(self, model: str, texts: list) -> list:
+        self.misses += len(texts)
+        return [None] * len(texts)
+
+    def put_many(self, model: str, texts: list, vectors: list):
+        pass
+
+    def stats(self) -> dict:
+        return {"hits": 0, "misses": self.misses, "hitRate": None}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Caché compartida del proceso (se abre en el primer uso)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache() if EMBEDDING_CACHE_ENABLED else _DisabledCache()
+        return _cache
+
+
+def cached_embeddings(model: str, texts: list, embed) -> list:
+    """Resuelve los embeddings de texts desde la caché y calcula con embed(lista) solo los faltantes."""
+    cache = get_embedding_cache()
+    with stage("embeddingCache"):
+        vectors = cache.get_many(model, texts)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    count("embeddingCache.hits", len(texts) - len(missing))
+    count("embeddingCache.misses", len(missing))
+    if missing:
+        # Textos repetidos dentro de la misma llamada se calculan una sola vez
+        unique = list(dict.fromkeys(texts[i] for i in missing))
+        computed = dict(zip(unique, embed(unique)))
+        with stage("embeddingCache"):
+            cache.put_many(model, unique, [computed[text] for text in unique])
+        for i in missing:
+            vectors[i] = computed[texts[i]]
+    return vectors
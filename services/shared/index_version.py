@@ -0,0 +1,26 @@
+import os
+import threading
+
+# Versión del contenido del índice: cambia cada vez que se indexan, actualizan o eliminan fragmentos.
+# Las cachés que dependen del contenido (respuestas) descartan las entradas de versiones anteriores.
+SERVICES_CACHE_DIR = os.getenv("SERVICES_CACHE_DIR") or os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".cache"))
+INDEX_VERSION_PATH = os.path.join(SERVICES_CACHE_DIR, "index_version")
+
+
+def get_index_version() -> str:
+    try:
+        with open(INDEX_VERSION_PATH, "r", encoding="utf-8") as f:
+            return f.read().strip() or "0"
+    except FileNotFoundError:
+        return "0"
+
+
+def bump_index_version() -> str:
+    """Registra una nueva versión del índice (escritura atómica, segura entre procesos)."""
+    version = os.urandom(16).hex()
+    os.makedirs(SERVICES_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{INDEX_VERSION_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, INDEX_VERSION_PATH)
+    return version
@@ -0,0 +1,169 @@
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+# Métricas por etapa para processDocumentService y questionsService: tiempo, solicitudes, tokens y caché
+SERVICES_CACHE_DIR = os.getenv("SERVICES_CACHE_DIR") or os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".cache"))
+SERVICES_METRICS = os.getenv("SERVICES_METRICS", "false").lower() == "true"
+SERVICES_PROFILE = os.getenv("SERVICES_PROFILE", "false").lower() == "true"
+PROFILE_DIR = os.getenv("SERVICES_PROFILE_DIR") or os.path.join(SERVICES_CACHE_DIR, "profiles")
+
+# Métricas de la solicitud en curso (None = no se recolectan); los hilos auxiliares la reciben con copy_context
+_current = ContextVar("services_metrics", default=None)
+# Etapas abiertas en el hilo actual, para descontar del padre el tiempo de las etapas anidadas
+_local = threading.local()
+# cProfile admite un solo perfil activo a la vez
+_profile_lock = threading.Lock()
+
+
+class Metrics:
+    """Acumula tiempo propio y llamadas por etapa y contadores de una solicitud (seguro entre hilos)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+
+    def add_time(self, name: str, seconds: float):
+        with self.lock:
+            entry = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+            entry["seconds"] += seconds
+            entry["calls"] += 1
+
+    def incr(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {
+                "totalSeconds": round(time.perf_counter() - self.started, 4),
+                "stages": {name: {"seconds": round(entry["seconds"], 4), "calls": entry["calls"]} for name, entry in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+
+def metrics_requested(data: dict) -> bool:
+    """La solicitud pide métricas con "metrics": true (o SERVICES_METRICS=true para todas)."""
+    return bool(data.get("metrics")) or SERVICES_METRICS
+
+
+def profile_requested(data: dict) -> bool:
+    return bool(data.get("profile")) or SERVICES_PROFILE
+
+
+def current_metrics():
+    return _current.get()
+
+
+@contextmanager
+def collect(enabled: bool = True):
+    """Recolecta las métricas de todo lo que se ejecute dentro del bloque; entrega el objeto Metrics (o None)."""
+    if not enabled:
+        yield None
+        return
+    metrics = Metrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """Mide el tiempo propio de una etapa: las etapas anidadas se descuentan y se reportan por separado."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    frame = [0.0]  # tiempo de etapas hijas
+    stack.append(frame)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stack.pop()
+        if stack:
+            stack[-1][0] += elapsed
+        metrics.add_time(name, elapsed - frame[0])
+
+
+def timed(name: str):
+    """Decorador: cada llamada a la función cuenta como una ejecución de la etapa name."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_iter(name: str, iterable):
+    """Atribuye a la etapa name el tiempo que tarda el iterable en producir cada elemento."""
+    iterator = iter(iterable)
+    try:
+        while True:
+            with stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close:
+            close()
+
+
+def count(name: str, value: int = 1):
+    metrics = _current.get()
+    if metrics is not None and value:
+        metrics.incr(name, value)
+
+
+def record_usage(prefix: str, response):
+    """Cuenta una solicitud a la API y los tokens que informa su respuesta (usage)."""
+    metrics = _current.get()
+    if metrics is None:
+        return
+    metrics.incr(f"{prefix}.requests")
+    usage = getattr(response, "usage", None)
+    for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        value = getattr(usage, field, None)
+        if value:
+            metrics.incr(f"{prefix}.{field}", value)
+
+
+@contextmanager
+def profiled(service: str, enabled: bool = True):
+    """Perfila el bloque con cProfile y guarda el resultado (.prof, legible con pstats o snakeviz).
+
+    Entrega la ruta del archivo, o None si no se pidió o si otro perfil está activo en el proceso.
+    Solo se perfila el hilo que ejecuta el bloque.
+    """
+    if not enabled or not _profile_lock.acquire(blocking=False):
+        yield None
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{service}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{threading.get_ident()}.prof")
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+        try:
+            yield path
+        finally:
+            profile.disable()
+            profile.dump_stats(path)
+    finally:
+        _profile_lock.release()
@@ -0,0 +1,284 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from functools import lru_cache
+from shared.index_version import SERVICES_CACHE_DIR
+
+# Detección de fragmentos casi idénticos (reediciones, numeración, espacios, ruido de OCR) con MinHash + LSH
+NEAR_DUPLICATES_ENABLED = os.getenv("NEAR_DUPLICATES", "true").lower() == "true"
+NEAR_DUPLICATES_PATH = os.getenv("NEAR_DUPLICATES_PATH") or os.path.join(SERVICES_CACHE_DIR, "near_duplicates.sqlite3")
+# Similitud de Jaccard estimada (secuencias de 3 palabras) a partir de la cual un fragmento se considera copia
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD") or 0.85)
+
+# 64 permutaciones en 16 bandas de 4: los pares con similitud >= 0.6 comparten alguna banda casi siempre
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+SHINGLE_WORDS = 3
+_PRIME = (1 << 61) - 1
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+
+@lru_cache(maxsize=None)
+def _coefficients():
+    """Coeficientes fijos (a, b) de las funciones hash; deben ser iguales en todos los procesos."""
+    import numpy as np
+
+    seed = hashlib.sha256(b"near-duplicates").digest()
+    values = []
+    while len(values) < 2 * NUM_PERMUTATIONS:
+        seed = hashlib.sha256(seed).digest()
+        values.extend(int.from_bytes(seed[i:i + 4], "little") for i in range(0, 32, 4))
+    a = np.array(values[:NUM_PERMUTATIONS], dtype=np.uint64) | np.uint64(1)
+    b = np.array(values[NUM_PERMUTATIONS:2 * NUM_PERMUTATIONS], dtype=np.uint64)
+    return a, b
+
+
+def shingles(text: str) -> set:
+    """Secuencias de palabras normalizadas: sin mayúsculas, tildes, números ni puntuación (numeración y ruido de OCR)."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    words = _WORD_RE.findall("".join(ch for ch in text if not unicodedata.combining(ch)))
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def signature(text: str):
+    """Firma MinHash (NUM_PERMUTATIONS valores uint32) del texto, o None si no tiene palabras."""
+    import numpy as np
+
+    values = shingles(text)
+    if not values:
+        return None
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=4).digest(), "little") for value in values],
+        dtype=np.uint64
+    )
+    a, b = _coefficients()
+    # (a * x + b) mod p con x < 2^32 y a, b < 2^32 no desborda uint64
+    mixed = (hashes[:, None] * a[None, :] + b[None, :]) % np.uint64(_PRIME)
+    return (mixed.min(axis=0) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+def band_keys(sig) -> list:
+    """Clave (banda, cubeta) de cada banda de la firma; los fragmentos parecidos comparten alguna."""
+    data = sig.tobytes()
+    size = ROWS_PER_BAND * 4
+    return [
+        (band, int.from_bytes(hashlib.blake2b(data[band * size:(band + 1) * size], digest_size=8).digest(), "little", signed=True))
+        for band in range(BANDS)
+    ]
+
+
+def age_scope(metadata: dict) -> str:
+    """Ámbito de un fragmento: solo se reutilizan vectores visibles para el mismo rango de edades."""
+    return f"{metadata.get('minAge', '')}|{metadata.get('maxAge', '')}"
+
+
+def similarity(first, second) -> float:
+    return float((first == second).mean())
+
+
+class NearDuplicateIndex:
+    """Firmas MinHash de los fragmentos indexados, con sus cubetas LSH, en SQLite (WAL) compartido entre procesos.
+
+    Cada firma pertenece al documento que creó el vector. Un fragmento casi idéntico de otro documento no crea
+    un vector nuevo: ese documento queda enlazado al existente (links) y, si el dueño se elimina, el vector pasa
+    al documento enlazado en lugar de borrarse. Solo se comparan fragmentos con el mismo ámbito (rango de edades).
+    """
+
+    def __init__(self, path: str = NEAR_DUPLICATES_PATH, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS signatures (
+                vector_id TEXT PRIMARY KEY,
+                document_id TEXT,
+                scope TEXT NOT NULL,
+                signature BLOB NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS buckets (band INTEGER NOT NULL, bucket INTEGER NOT NULL, vector_id TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS links (vector_id TEXT NOT NULL, document_id TEXT NOT NULL, PRIMARY KEY (vector_id, document_id))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_key ON buckets (band, bucket)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_vector ON buckets (vector_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_signatures_document ON signatures (document_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_links_document ON links (document_id)")
+
+    def find(self, sig, scope: str):
+        """Id del vector indexado más parecido del mismo ámbito con similitud >= threshold, o None."""
+        import numpy as np
+
+        keys = band_keys(sig)
+        placeholders = ",".join("(?, ?)" for _ in keys)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT vector_id, signature FROM signatures WHERE scope = ? AND vector_id IN "
+                f"(SELECT vector_id FROM buckets WHERE (band, bucket) IN (VALUES {placeholders}))",
+                [scope] + [value for key in keys for value in key]
+            ).fetchall()
+        best_id, best = None, self.threshold
+        for vector_id, blob in rows:
+            score = similarity(sig, np.frombuffer(blob, dtype=np.uint32))
+            if score >= best:
+                best_id, best = vector_id, score
+        return best_id
+
+    def add(self, entries: list, document_id: str, scope: str):
+        """Registra firmas [(vector_id, firma)] de fragmentos recién indexados por document_id."""
+        entries = [(vector_id, sig) for vector_id, sig in entries if sig is not None]
+        if not entries:
+            return
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [(vector_id,) for vector_id, _ in entries]
+                self.conn.executemany("DELETE FROM buckets WHERE vector_id = ?", ids)
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO signatures (vector_id, document_id, scope, signature) VALUES (?, ?, ?, ?)",
+                    [(vector_id, document_id, scope, sig.tobytes()) for vector_id, sig in entries]
+                )
+                self.conn.executemany(
+                    "INSERT INTO buckets (band, bucket, vector_id) VALUES (?, ?, ?)",
+                    [(band, bucket, vector_id) for vector_id, sig in entries for band, bucket in band_keys(sig)]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def link(self, vector_ids: list, document_id: str):
+        """Enlaza document_id a vectores existentes que reutiliza en lugar de indexar sus copias (salvo los que ya son suyos)."""
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO links (vector_id, document_id) SELECT ?, ? "
+                "WHERE NOT EXISTS (SELECT 1 FROM signatures WHERE vector_id = ? AND document_id = ?)",
+                [(vector_id, document_id, vector_id, document_id) for vector_id in vector_ids]
+            )
+
+    def owners(self, vector_ids: list) -> dict:
+        """{id: documento dueño} de los vectores con firma registrada."""
+        found = {}
+        with self.lock:
+            for start in range(0, len(vector_ids), 500):
+                chunk = vector_ids[start:start + 500]
+                found.update(self.conn.execute(
+                    f"SELECT vector_id, document_id FROM signatures WHERE vector_id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+        return found
+
+    def reassign(self, vector_ids: list, previous_ids: tuple, document_id: str, scope: str):
+        """Pasa a document_id las firmas y enlaces de previous_ids (reindexación que reemplaza a otro identificador o cambia edades)."""
+        marks = ",".join("?" * len(previous_ids))
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for vector_id in vector_ids:
+                    self.conn.execute(
+                        f"UPDATE signatures SET document_id = ?, scope = ? WHERE vector_id = ? AND document_id IN ({marks})",
+                        (document_id, scope, vector_id, *previous_ids)
+                    )
+                    self.conn.execute(
+                        f"UPDATE OR IGNORE links SET document_id = ? WHERE vector_id = ? AND document_id IN ({marks})",
+                        (document_id, vector_id, *previous_ids)
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def release(self, vector_ids: list, document_ids: tuple) -> tuple:
+        """Libera los vectores de un documento que se elimina (document_ids: su identificador y el que reemplaza).
+
+        Devuelve (ids a eliminar, {id: documento que pasa a ser su dueño}): los vectores de otro dueño solo
+        pierden el enlace, y los propios que otro documento reutiliza pasan a ese documento.
+        """
+        to_delete = []
+        transfers = {}
+        marks = ",".join("?" * len(document_ids))
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for vector_id in vector_ids:
+                    self.conn.execute(f"DELETE FROM links WHERE vector_id = ? AND document_id IN ({marks})", (vector_id, *document_ids))
+                    row = self.conn.execute("SELECT document_id FROM signatures WHERE vector_id = ?", (vector_id,)).fetchone()
+                    if row and row[0] not in document_ids:
+                        continue
+                    heir = self.conn.execute("SELECT document_id FROM links WHERE vector_id = ? LIMIT 1", (vector_id,)).fetchone()
+                    if heir:
+                        self.conn.execute("UPDATE signatures SET document_id = ? WHERE vector_id = ?", (heir[0], vector_id))
+                        self.conn.execute("DELETE FROM links WHERE vector_id = ? AND document_id = ?", (vector_id, heir[0]))
+                        transfers[vector_id] = heir[0]
+                    else:
+                        to_delete.append(vector_id)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return to_delete, transfers
+
+    def remove(self, vector_ids: list = None, document_id: str = None):
+        """Elimina las firmas y enlaces de vectores borrados (por id o por documento)."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if document_id is not None:
+                    vector_ids = [row[0] for row in self.conn.execute("SELECT vector_id FROM signatures WHERE document_id = ?", (document_id,))]
+                    self.conn.execute("DELETE FROM links WHERE document_id = ?", (document_id,))
+                ids = [(vector_id,) for vector_id in vector_ids or []]
+                self.conn.executemany("DELETE FROM buckets WHERE vector_id = ?", ids)
+                self.conn.executemany("DELETE FROM signatures WHERE vector_id = ?", ids)
+                self.conn.executemany("DELETE FROM links WHERE vector_id = ?", ids)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+
+class _DisabledIndex:
+    """Sustituto sin efecto cuando NEAR_DUPLICATES=false."""
+
+    threshold = 1.0
+
+    def find(self, sig, scope: str):
+        return None
+
+    def add(self, entries: list, document_id: str, scope: str):
+        pass
+
+    def link(self, vector_ids: list, document_id: str):
+        pass
+
+    def owners(self, vector_ids: list) -> dict:
+        return {}
+
+    def reassign(self, vector_ids: list, previous_ids: tuple, document_id: str, scope: str):
+        pass
+
+    def release(self, vector_ids: list, document_ids: tuple) -> tuple:
+        return list(vector_ids), {}
+
+    def remove(self, vector_ids: list = None, document_id: str = None):
+        pass
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_near_duplicates():
+    """Índice de firmas del proceso (se abre en el primer uso)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = NearDuplicateIndex() if NEAR_DUPLICATES_ENABLED else _DisabledIndex()
+        return _index
@@ -0,0 +1,304 @@
+import contextvars
+import email.utils
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from shared.metrics import count, stage
+
+# Planificador de las llamadas salientes (OpenAI, Pinecone) de cada proceso: limita las solicitudes simultáneas
+# ({SERVICIO}_CONCURRENCY) y el ritmo por minuto ({SERVICIO}_RPM solicitudes, {SERVICIO}_TPM tokens; 0 = sin límite).
+# Los presupuestos son por proceso: si varios procesos comparten la cuota, se reparte entre ellos.
+DEFAULT_CONCURRENCY = 32
+# Reintentos ante 429, errores 5xx y fallas de conexión; espera base y máxima (s) del backoff exponencial con jitter
+SCHEDULER_MAX_RETRIES = int(os.getenv("SCHEDULER_MAX_RETRIES") or 5)
+SCHEDULER_BACKOFF = float(os.getenv("SCHEDULER_BACKOFF") or 1.0)
+SCHEDULER_MAX_BACKOFF = float(os.getenv("SCHEDULER_MAX_BACKOFF") or 30.0)
+# Hilos compartidos para enviar en paralelo los lotes de una misma etapa (embeddings, carga de vectores)
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS") or 16)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Fallas de red de los SDK (openai usa httpx, pinecone urllib3): se reconocen por el nombre de la excepción
+_TRANSIENT_NAMES = ("Connection", "Timeout", "ProtocolError", "MaxRetryError")
+
+
+class RateLimited(Exception):
+    """El servicio siguió respondiendo 429 después de todos los reintentos."""
+
+
+class Budget:
+    """Cubeta que se rellena de forma continua hasta limit unidades por minuto (limit 0 = sin límite)."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.available = float(limit)
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Descuenta amount (puede quedar en negativo) y devuelve cuántos segundos esperar hasta que estuviera disponible."""
+        if not self.limit or amount <= 0:
+            return 0.0
+        self.available = min(self.limit, self.available + (now - self.updated) * self.limit / 60)
+        self.updated = now
+        self.available -= amount
+        return max(0.0, -self.available * 60 / self.limit)
+
+
+def status_of(error: Exception):
+    """Código HTTP de la excepción de un SDK (openai: status_code, pinecone: status), si tiene."""
+    for attribute in ("status_code", "status"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def retry_after(error: Exception):
+    """Segundos indicados por el servicio (retry-after-ms o Retry-After, en segundos o como fecha), o None."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def is_transient(error: Exception) -> bool:
+    status = status_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return isinstance(error, (ConnectionError, TimeoutError)) or any(name in type(error).__name__ for name in _TRANSIENT_NAMES)
+
+
+class Scheduler:
+    """Limita y reintenta las llamadas a un servicio externo (seguro entre hilos).
+
+    Cada llamada espera un lugar libre y su parte del presupuesto por minuto; mientras espera, el hilo que
+    la hizo queda bloqueado, lo que frena a las etapas anteriores del pipeline (sus colas son acotadas).
+    Un 429 pausa a todo el servicio durante el Retry-After indicado y reduce a la mitad los lugares
+    (que vuelven a crecer de a uno con las respuestas exitosas), para que al reanudar no se repita el 429.
+    """
+
+    def __init__(self, name: str, rpm: int = 0, tpm: int = 0, concurrency: int = DEFAULT_CONCURRENCY,
+                 max_retries: int = SCHEDULER_MAX_RETRIES, backoff: float = SCHEDULER_BACKOFF, max_backoff: float = SCHEDULER_MAX_BACKOFF):
+        self.name = name
+        self.requests = Budget(rpm)
+        self.tokens = Budget(tpm)
+        self.concurrency = max(1, concurrency)
+        # Lugares disponibles ahora (entre 1 y concurrency) y respuestas exitosas desde el último ajuste
+        self.limit = self.concurrency
+        self.successes = 0
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.random = random.Random()
+        self.lock = threading.Lock()
+        self.available = threading.Condition(self.lock)
+        self.paused_until = 0.0
+        self.counts = {"requests": 0, "inflight": 0, "waiting": 0, "maxWaiting": 0, "throttled": 0, "retries": 0, "failed": 0}
+        self.wait_seconds = 0.0
+
+    def _add(self, name: str, value: int = 1):
+        with self.lock:
+            self.counts[name] += value
+
+    def _acquire(self, tokens: int):
+        """Toma un lugar y el presupuesto de una solicitud; bloquea (backpressure) mientras no haya."""
+        started = time.monotonic()
+        with self.lock:
+            self.counts["waiting"] += 1
+            self.counts["maxWaiting"] = max(self.counts["maxWaiting"], self.counts["waiting"])
+        try:
+            with stage("rateLimit"):
+                with self.available:
+                    while self.counts["inflight"] >= self.limit:
+                        self.available.wait()
+                    self.counts["inflight"] += 1
+                    now = time.monotonic()
+                    delay = max(self.paused_until - now, self.requests.reserve(1, now), self.tokens.reserve(tokens, now))
+                if delay > 0:
+                    time.sleep(delay)
+        finally:
+            waited = time.monotonic() - started
+            with self.lock:
+                self.counts["waiting"] -= 1
+                self.counts["requests"] += 1
+                self.wait_seconds += waited
+        if waited > 0.001:
+            count(f"{self.name}.waits")
+
+    def _release(self, throttled: bool = False):
+        with self.available:
+            self.counts["inflight"] -= 1
+            if throttled:
+                self.limit = max(1, self.limit // 2)
+                self.successes = 0
+            elif self.limit < self.concurrency:
+                self.successes += 1
+                if self.successes >= self.limit:
+                    self.limit += 1
+                    self.successes = 0
+            self.available.notify_all()
+
+    def _delay(self, attempt: int, error: Exception) -> float:
+        """Espera antes del reintento: backoff exponencial con jitter, nunca menor que el Retry-After del servicio.
+
+        Un Retry-After corto solo indica cuándo se libera la próxima solicitud; si todas las llamadas rechazadas
+        reintentaran en ese momento volverían a recibir 429, por eso cada una espera también su propio backoff.
+        """
+        with self.lock:
+            jitter = self.random.random()
+        backoff = min(self.max_backoff, self.backoff * 2 ** attempt) * (0.5 + jitter / 2)
+        return max(retry_after(error) or 0.0, backoff)
+
+    def call(self, func, *args, tokens: int = 0, **kwargs):
+        """Ejecuta func(*args, **kwargs) respetando los límites; tokens es la estimación que consume del presupuesto por minuto.
+
+        Reintenta los 429 (respetando Retry-After), los errores 5xx y las fallas de conexión; si los 429 persisten
+        o piden esperar más de max_backoff lanza RateLimited. Los demás errores se propagan sin reintentar.
+        """
+        result = self._start(func, args, kwargs, tokens)
+        self._release()
+        return result
+
+    @contextmanager
+    def stream(self, func, *args, tokens: int = 0, **kwargs):
+        """Como call, pero para respuestas en streaming: el lugar se conserva hasta salir del bloque with.
+
+        Los reintentos cubren solo el inicio de la respuesta; un corte a mitad del streaming se propaga. Al salir
+        se cierra la respuesta (si no se consumió completa) y se libera el lugar.
+        """
+        response = self._start(func, args, kwargs, tokens)
+        throttled = False
+        try:
+            yield response
+        except Exception as error:
+            throttled = status_of(error) == 429
+            raise
+        finally:
+            try:
+                close = getattr(response, "close", None)
+                if close is not None:
+                    close()
+            finally:
+                self._release(throttled)
+
+    def _start(self, func, args: tuple, kwargs: dict, tokens: int):
+        """Reintenta func hasta obtener respuesta; al volver, el lugar sigue tomado y lo libera quien llama."""
+        for attempt in range(self.max_retries + 1):
+            self._acquire(tokens)
+            throttled = False
+            release = True
+            try:
+                result = func(*args, **kwargs)
+                release = False
+                return result
+            except Exception as error:
+                throttled = status_of(error) == 429
+                if throttled:
+                    self._add("throttled")
+                    count(f"{self.name}.throttled")
+                hinted = retry_after(error)
+                # Un Retry-After mayor que la espera máxima (p. ej. la cuota diaria agotada) no se espera
+                if not is_transient(error) or attempt == self.max_retries or (hinted or 0) > self.max_backoff:
+                    self._add("failed")
+                    if throttled:
+                        raise RateLimited(f"{self.name}: límite de solicitudes excedido tras {attempt} reintentos") from error
+                    raise
+                delay = self._delay(attempt, error)
+                if throttled and hinted:
+                    # Las demás llamadas al servicio también esperan lo que indicó el servicio
+                    with self.lock:
+                        self.paused_until = max(self.paused_until, time.monotonic() + hinted)
+                self._add("retries")
+                count(f"{self.name}.retries")
+            finally:
+                if release:
+                    self._release(throttled)
+            with stage("rateLimit"):
+                time.sleep(delay)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                **self.counts,
+                "concurrency": self.concurrency,
+                "limit": self.limit,
+                "rpm": self.requests.limit,
+                "tpm": self.tokens.limit,
+                "waitSeconds": round(self.wait_seconds, 3),
+            }
+
+
+class ScheduledIndex:
+    """pinecone.Index cuyas operaciones de datos pasan por el planificador (misma interfaz)."""
+
+    SCHEDULED = ("upsert", "query", "fetch", "update", "delete", "describe_index_stats")
+
+    def __init__(self, index, scheduler: Scheduler):
+        self.index = index
+        self.scheduler = scheduler
+
+    def __getattr__(self, name):
+        attribute = getattr(self.index, name)
+        return partial(self.scheduler.call, attribute) if name in self.SCHEDULED else attribute
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(name: str) -> Scheduler:
+    """Planificador del proceso para el servicio name (openai, pinecone), configurado con {NAME}_RPM, _TPM y _CONCURRENCY."""
+    with _schedulers_lock:
+        if name not in _schedulers:
+            prefix = name.upper()
+            _schedulers[name] = Scheduler(
+                name,
+                rpm=int(os.getenv(f"{prefix}_RPM") or 0),
+                tpm=int(os.getenv(f"{prefix}_TPM") or 0),
+                concurrency=int(os.getenv(f"{prefix}_CONCURRENCY") or DEFAULT_CONCURRENCY)
+            )
+        return _schedulers[name]
+
+
+def scheduler_stats() -> dict:
+    """Estado de los planificadores usados por el proceso: en curso, en espera (profundidad de la cola) y limitaciones."""
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return {scheduler.name: scheduler.stats() for scheduler in schedulers}
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def run_all(func, items: list) -> list:
+    """Aplica func a cada elemento en paralelo (con el contexto actual, p. ej. las métricas) y devuelve los resultados en orden.
+
+    Los planificadores de las llamadas que haga func limitan cuántas llegan a la vez al servicio.
+    """
+    global _executor
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SCHEDULER_WORKERS)
+    futures = [_executor.submit(contextvars.copy_context().run, func, item) for item in items]
+    return [future.result() for future in futures]
@@ -0,0 +1,53 @@
+import math
+import os
+from functools import lru_cache
+
+# Conteo local de tokens (sin llamar a la API): tiktoken si está instalado, si no una estimación por caracteres
+TOKENIZER_MODEL = os.getenv("OPENAI_LLM_MODEL", "gpt-4o-mini")
+# Caracteres por token de la estimación; en español ronda 3.5-4, se usa el valor bajo para no quedarse corto
+CHARS_PER_TOKEN = float(os.getenv("TOKENIZER_CHARS_PER_TOKEN") or 3.5)
+
+
+@lru_cache(maxsize=None)
+def get_encoding():
+    """Codificación de tiktoken para el modelo, o None si no está disponible (paquete o archivo BPE)."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(TOKENIZER_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # Sin red para descargar el archivo BPE la primera vez
+        return None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_tokens(text: str, limit: int) -> str:
+    """Recorta text a como mucho limit tokens (incluido el "…" final), terminando en un límite de palabra cuando es posible."""
+    if limit <= 0:
+        return ""
+    encoding = get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= limit:
+            return text
+        cut = encoding.decode(tokens[:limit - 1])
+    else:
+        size = int(limit * CHARS_PER_TOKEN)
+        if len(text) <= size:
+            return text
+        cut = text[:int((limit - 1) * CHARS_PER_TOKEN)]
+    # No dejar una palabra a medias; si el texto no tiene espacios se deja el corte exacto
+    space = cut.rfind(" ")
+    return (cut[:space] if space > len(cut) // 2 else cut).rstrip() + "…"
@@ -0,0 +1,489 @@
+import json
+import os
+import sqlite3
+import threading
+from types import SimpleNamespace
+from shared.index_version import SERVICES_CACHE_DIR, bump_index_version, get_index_version
+
+# Índice vectorial local: alternativa a Pinecone para consultar (y opcionalmente indexar) sin red.
+#   pinecone: solo Pinecone (por defecto)
+#   local:    solo el índice local (sin dependencias externas para recuperar ni indexar)
+#   both:     la indexación escribe en ambos y las preguntas consultan el índice local
+VECTOR_BACKEND = (os.getenv("VECTOR_BACKEND") or "pinecone").lower()
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR") or os.path.join(SERVICES_CACHE_DIR, "vectors")
+VECTOR_DIMENSION = int(os.getenv("VECTOR_DIMENSION") or 1536)
+# Filas por bloque en la búsqueda sin filtros (limita la memoria temporal de los productos punto)
+QUERY_CHUNK_ROWS = 65536
+
+# Columnas numéricas (una por archivo, una fila por vector) usadas para filtrar sin tocar SQLite
+_COLUMNS = {"alive": "u1", "category": "i4", "minAge": "i4", "maxAge": "i4"}
+_MISSING = -2 ** 31
+_SQL_CHUNK = 500
+
+
+def _age(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return _MISSING
+
+
+class LocalIndex:
+    """Índice vectorial en disco con la misma interfaz que usamos de pinecone.Index.
+
+    Los embeddings (float32 normalizados, métrica coseno) y las columnas de filtrado (categoría, minAge,
+    maxAge, vigente) son archivos binarios que se abren con memmap, así que cargar el índice no depende
+    de su tamaño. Los metadatos completos y la asignación de filas viven en SQLite (WAL), que también
+    serializa a los escritores entre procesos. Las filas eliminadas se marcan y se descartan con compact().
+    """
+
+    def __init__(self, path: str = VECTOR_STORE_DIR, dimension: int = VECTOR_DIMENSION):
+        self.path = path
+        self.dimension = dimension
+        self.lock = threading.RLock()
+        self.loaded_version = None
+        self.rows = 0
+        self.matrix = None
+        self.columns = {}
+        self.categories = {}
+
+        os.makedirs(path, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(path, "metadata.sqlite3"), timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS vectors (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                document_id TEXT,
+                sha1 TEXT,
+                metadata TEXT NOT NULL,
+                alive INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_vectors_id ON vectors (id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_vectors_document ON vectors (document_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_vectors_sha1 ON vectors (sha1)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS categories (code INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)")
+
+    # ---- Archivos ----
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, "vectors.f32" if name == "vectors" else f"{name}.col")
+
+    def _write_at(self, name: str, row: int, data: bytes, itemsize: int, truncate: bool = False):
+        path = self._file(name)
+        with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+            f.seek(row * itemsize)
+            f.write(data)
+            if truncate:
+                # Descarta restos de escrituras interrumpidas más allá de la última fila confirmada
+                f.truncate()
+
+    def _load(self):
+        """Abre (o reabre) los memmaps si otro proceso o este mismo modificó el índice."""
+        import numpy as np
+
+        version = get_index_version()
+        if version == self.loaded_version and self.matrix is not None:
+            return
+        rows = self.conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM vectors").fetchone()[0]
+        self.categories = dict(self.conn.execute("SELECT name, code FROM categories").fetchall())
+        if rows:
+            self.matrix = np.memmap(self._file("vectors"), dtype=np.float32, mode="r", shape=(rows, self.dimension))
+            self.columns = {name: np.memmap(self._file(name), dtype=dtype, mode="r", shape=(rows,)) for name, dtype in _COLUMNS.items()}
+        else:
+            self.matrix = np.zeros((0, self.dimension), dtype=np.float32)
+            self.columns = {name: np.zeros(0, dtype=dtype) for name, dtype in _COLUMNS.items()}
+        self.rows = rows
+        self.loaded_version = version
+
+    def _invalidate(self):
+        self.loaded_version = None
+        self.matrix = None
+
+    def _category_code(self, name) -> int:
+        if name is None:
+            return _MISSING
+        self.conn.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (str(name),))
+        return self.conn.execute("SELECT code FROM categories WHERE name = ?", (str(name),)).fetchone()[0]
+
+    def _rows_where(self, clause: str, values: list) -> list:
+        rows = []
+        for start in range(0, max(len(values), 1), _SQL_CHUNK):
+            chunk = values[start:start + _SQL_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows.extend(row for (row,) in self.conn.execute(
+                f"SELECT row FROM vectors WHERE alive = 1 AND {clause} IN ({placeholders})", chunk
+            ))
+        return rows
+
+    def _kill(self, rows: list):
+        if not rows:
+            return
+        self.conn.executemany("UPDATE vectors SET alive = 0 WHERE row = ?", [(row,) for row in rows])
+        with open(self._file("alive"), "r+b") as f:
+            for row in rows:
+                f.seek(row)
+                f.write(b"\x00")
+
+    # ---- Interfaz compatible con pinecone.Index ----
+    def upsert(self, vectors: list, namespace: str = None):
+        """Agrega vectores al final; si un id ya existía, su fila anterior queda marcada como eliminada."""
+        import numpy as np
+
+        if not vectors:
+            return
+        matrix = np.asarray([vector["values"] for vector in vectors], dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+        metadata = [vector.get("metadata") or {} for vector in vectors]
+
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._kill(self._rows_where("id", [vector["id"] for vector in vectors]))
+                start = self.conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM vectors").fetchone()[0]
+                columns = {
+                    "alive": np.ones(len(vectors), dtype="u1"),
+                    "category": np.asarray([self._category_code(meta.get("category")) for meta in metadata], dtype="i4"),
+                    "minAge": np.asarray([_age(meta.get("minAge")) for meta in metadata], dtype="i4"),
+                    "maxAge": np.asarray([_age(meta.get("maxAge")) for meta in metadata], dtype="i4"),
+                }
+                self._write_at("vectors", start, matrix.tobytes(), self.dimension * 4, truncate=True)
+                for name, values in columns.items():
+                    self._write_at(name, start, values.tobytes(), values.itemsize, truncate=True)
+                self.conn.executemany(
+                    "INSERT INTO vectors (row, id, document_id, sha1, metadata, alive) VALUES (?, ?, ?, ?, ?, 1)",
+                    [
+                        (start + i, vector["id"], meta.get("document_id"), meta.get("sha1"), json.dumps(meta))
+                        for i, (vector, meta) in enumerate(zip(vectors, metadata))
+                    ]
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self._invalidate()
+
+    def fetch(self, ids: list, namespace: str = None):
+        with self.lock:
+            found = {}
+            for start in range(0, len(ids), _SQL_CHUNK):
+                chunk = ids[start:start + _SQL_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                for vector_id, metadata in self.conn.execute(
+                    f"SELECT id, metadata FROM vectors WHERE alive = 1 AND id IN ({placeholders})", chunk
+                ):
+                    found[vector_id] = {"id": vector_id, "metadata": json.loads(metadata)}
+        return SimpleNamespace(vectors=found)
+
+    def update(self, id: str, set_metadata: dict, namespace: str = None):
+        import numpy as np
+
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for row, metadata in self.conn.execute("SELECT row, metadata FROM vectors WHERE alive = 1 AND id = ?", (id,)).fetchall():
+                    metadata = {**json.loads(metadata), **set_metadata}
+                    self.conn.execute(
+                        "UPDATE vectors SET metadata = ?, document_id = ? WHERE row = ?",
+                        (json.dumps(metadata), metadata.get("document_id"), row)
+                    )
+                    if "category" in set_metadata:
+                        self._write_at("category", row, np.asarray([self._category_code(metadata.get("category"))], dtype="i4").tobytes(), 4)
+                    for field in ("minAge", "maxAge"):
+                        if field in set_metadata:
+                            self._write_at(field, row, np.asarray([_age(metadata.get(field))], dtype="i4").tobytes(), 4)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self._invalidate()
+
+    def delete(self, ids: list = None, filter: dict = None, namespace: str = None):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if ids is not None:
+                    self._kill(self._rows_where("id", list(ids)))
+                if filter is not None:
+                    self._load_committed()
+                    self._kill([int(row) for row in self._mask(filter).nonzero()[0]])
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self._invalidate()
+
+    def query(self, vector: list, top_k: int = 10, include_metadata: bool = True, filter: dict = None, namespace: str = None, **kwargs):
+        """Top-k por similitud coseno entre las filas vigentes que cumplen el filtro (búsqueda exhaustiva)."""
+        import numpy as np
+
+        query = np.asarray(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) + 1e-12
+        with self.lock:
+            self._load()
+            if filter is None:
+                candidates = None
+                scores = np.concatenate([
+                    self.matrix[start:start + QUERY_CHUNK_ROWS] @ query
+                    for start in range(0, self.rows, QUERY_CHUNK_ROWS)
+                ]) if self.rows else np.zeros(0, dtype=np.float32)
+                scores[self.columns["alive"][:self.rows] == 0] = -np.inf
+            else:
+                # Prefiltrado: solo se calculan similitudes para las filas que cumplen el filtro
+                candidates = np.flatnonzero(self._mask(filter))
+                scores = self.matrix[candidates] @ query if len(candidates) else np.zeros(0, dtype=np.float32)
+
+            k = min(top_k, int(np.isfinite(scores).sum()))
+            if k <= 0:
+                return QueryResult(matches=[])
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            rows = candidates[best] if candidates is not None else best
+            metadata = {}
+            if include_metadata:
+                placeholders = ",".join("?" * len(rows))
+                metadata = {
+                    row: json.loads(meta) for row, meta in
+                    self.conn.execute(f"SELECT row, metadata FROM vectors WHERE row IN ({placeholders})", [int(row) for row in rows])
+                }
+            ids = dict(self.conn.execute(
+                f"SELECT row, id FROM vectors WHERE row IN ({','.join('?' * len(rows))})", [int(row) for row in rows]
+            ).fetchall())
+
+        return QueryResult(matches=[
+            Match(id=ids[int(row)], score=float(score), metadata=metadata.get(int(row), {}))
+            for row, score in zip(rows, scores[best])
+        ])
+
+    def describe_index_stats(self, **kwargs) -> dict:
+        with self.lock:
+            self._load()
+            return {"dimension": self.dimension, "total_vector_count": int(self.columns["alive"].sum()) if self.rows else 0}
+
+    # ---- Filtros (subconjunto del lenguaje de filtros de Pinecone) ----
+    def _mask(self, filter: dict):
+        """Máscara booleana de las filas vigentes que cumplen el filtro ($eq, $ne, $in, $nin, $gt, $gte, $lt, $lte, $exists, $and, $or)."""
+        import numpy as np
+
+        mask = self.columns["alive"][:self.rows].astype(bool)
+        for key, condition in filter.items():
+            if key == "$and":
+                for part in condition:
+                    mask &= self._mask(part)
+            elif key == "$or":
+                alternatives = np.zeros(self.rows, dtype=bool)
+                for part in condition:
+                    alternatives |= self._mask(part)
+                mask &= alternatives
+            else:
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                for operator, value in condition.items():
+                    mask &= self._field_mask(key, operator, value)
+        return mask
+
+    def _field_mask(self, field: str, operator: str, value):
+        import numpy as np
+
+        if field in ("minAge", "maxAge"):
+            column = self.columns[field][:self.rows]
+            present = column != _MISSING
+            if operator == "$exists":
+                return present if value else ~present
+            if operator in ("$in", "$nin"):
+                selected = np.isin(column, [_age(v) for v in value]) & present
+                return selected if operator == "$in" else ~selected
+            compare = {"$eq": np.equal, "$ne": np.not_equal, "$gt": np.greater, "$gte": np.greater_equal, "$lt": np.less, "$lte": np.less_equal}
+            return present & compare[operator](column, _age(value))
+
+        if field == "category":
+            column = self.columns["category"][:self.rows]
+            if operator == "$exists":
+                return (column != _MISSING) if value else (column == _MISSING)
+            values = value if operator in ("$in", "$nin") else [value]
+            codes = [self.categories[v] for v in values if v in self.categories]
+            selected = np.isin(column, codes)
+            if operator in ("$eq", "$in"):
+                return selected
+            if operator in ("$ne", "$nin"):
+                return ~selected
+            raise ValueError(f"Operador no soportado para category: {operator}")
+
+        # Resto de campos: se resuelven en SQLite y se convierten en máscara
+        expression = field if field in ("id", "document_id", "sha1") else f"json_extract(metadata, '$.{field}')"
+        if operator == "$exists":
+            rows = [row for (row,) in self.conn.execute(f"SELECT row FROM vectors WHERE alive = 1 AND {expression} IS {'NOT ' if value else ''}NULL")]
+        elif operator in ("$eq", "$in"):
+            rows = self._rows_where(expression, list(value) if operator == "$in" else [value])
+        elif operator in ("$ne", "$nin"):
+            excluded = set(self._rows_where(expression, list(value) if operator == "$nin" else [value]))
+            rows = [row for row in range(self.rows) if row not in excluded]
+        else:
+            sql = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}[operator]
+            rows = [row for (row,) in self.conn.execute(f"SELECT row FROM vectors WHERE alive = 1 AND {expression} {sql} ?", (value,))]
+        mask = np.zeros(self.rows, dtype=bool)
+        mask[[row for row in rows if row < self.rows]] = True
+        return mask
+
+    # ---- Mantenimiento ----
+    def category_sums(self) -> dict:
+        """{categoría: (suma de embeddings, cantidad)} de los fragmentos vigentes (los embeddings ya están normalizados)."""
+        with self.lock:
+            self._load()
+            if not self.rows:
+                return {}
+            alive = self.columns["alive"][:self.rows].astype(bool)
+            codes = self.columns["category"][:self.rows]
+            return {
+                name: (self.matrix[mask].sum(axis=0), int(mask.sum()))
+                for name, code in self.categories.items()
+                for mask in [alive & (codes == code)]
+                if mask.any()
+            }
+
+    def compact(self) -> dict:
+        """Reescribe el índice sin las filas eliminadas (instantánea compacta) y lo reemplaza de forma atómica."""
+        import numpy as np
+
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            replaced = {}
+            try:
+                self._load_committed()
+                keep = np.flatnonzero(self.columns["alive"][:self.rows]) if self.rows else np.zeros(0, dtype=np.int64)
+                files = {"vectors": self.matrix[keep]}
+                files.update({name: self.columns[name][keep] for name in _COLUMNS})
+                for name, values in files.items():
+                    tmp_path = f"{self._file(name)}.tmp"
+                    with open(tmp_path, "wb") as f:
+                        f.write(np.ascontiguousarray(values).tobytes())
+
+                # Las filas vigentes conservan su orden, así que su nuevo número es su posición
+                self.conn.execute("ALTER TABLE vectors RENAME TO vectors_old")
+                self._create_tables()
+                self.conn.execute(
+                    "INSERT INTO vectors (row, id, document_id, sha1, metadata, alive) "
+                    "SELECT ROW_NUMBER() OVER (ORDER BY row) - 1, id, document_id, sha1, metadata, 1 FROM vectors_old WHERE alive = 1"
+                )
+                self.conn.execute("DROP TABLE vectors_old")
+                # Los índices se quedaron con la tabla anterior: se vuelven a crear sobre la nueva
+                self._create_tables()
+
+                # Los archivos anteriores se conservan (.old) hasta que SQLite confirme la nueva numeración
+                self.matrix = None
+                self.columns = {}
+                for name in files:
+                    path = self._file(name)
+                    replaced[name] = os.path.exists(path)
+                    if replaced[name]:
+                        os.replace(path, f"{path}.old")
+                    os.replace(f"{path}.tmp", path)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                for name, existed in replaced.items():
+                    path = self._file(name)
+                    if existed:
+                        os.replace(f"{path}.old", path)
+                    elif os.path.exists(path):
+                        os.remove(path)
+                for name in ["vectors", *_COLUMNS]:
+                    if os.path.exists(f"{self._file(name)}.tmp"):
+                        os.remove(f"{self._file(name)}.tmp")
+                self._invalidate()
+                raise
+            removed = self.rows - len(keep)
+            self._invalidate()
+            # Los procesos que tengan el índice abierto deben recargarlo con la nueva numeración; la versión
+            # cambia antes de soltar el candado para que ningún escritor de este proceso se intercale
+            bump_index_version()
+            for name, existed in replaced.items():
+                if existed:
+                    os.remove(f"{self._file(name)}.old")
+        return {"removed": removed, "rows": len(keep)}
+
+    def _load_committed(self):
+        self.loaded_version = None
+        self._load()
+
+
+class QueryResult(dict):
+    """Respuesta de query con el mismo acceso que la de Pinecone (results.matches o results["matches"])."""
+
+    @property
+    def matches(self):
+        return self["matches"]
+
+
+class Match(dict):
+    @property
+    def id(self):
+        return self["id"]
+
+    @property
+    def score(self):
+        return self["score"]
+
+    @property
+    def metadata(self):
+        return self["metadata"]
+
+
+class MirroredIndex:
+    """Escribe en Pinecone y en el índice local; las lecturas (verificación de duplicados) van a Pinecone."""
+
+    def __init__(self, primary, local: LocalIndex):
+        self.primary = primary
+        self.local = local
+
+    def upsert(self, vectors: list, namespace: str = None):
+        self.primary.upsert(vectors=vectors, namespace=namespace)
+        self.local.upsert(vectors=vectors, namespace=namespace)
+
+    def update(self, id: str, set_metadata: dict, namespace: str = None):
+        self.primary.update(id=id, set_metadata=set_metadata, namespace=namespace)
+        self.local.update(id=id, set_metadata=set_metadata, namespace=namespace)
+
+    def delete(self, ids: list = None, filter: dict = None, namespace: str = None):
+        if ids is not None:
+            self.primary.delete(ids=ids, namespace=namespace)
+        else:
+            self.primary.delete(filter=filter, namespace=namespace)
+        self.local.delete(ids=ids, filter=filter, namespace=namespace)
+
+    def __getattr__(self, name):
+        return getattr(self.primary, name)
+
+
+_local_index = None
+_local_lock = threading.Lock()
+
+
+def get_local_index() -> LocalIndex:
+    """Índice local del proceso (se abre en el primer uso)."""
+    global _local_index
+    with _local_lock:
+        if _local_index is None:
+            _local_index = LocalIndex()
+        return _local_index
+
+
+def load_from_pinecone(index, namespace: str, batch_size: int = 100) -> int:
+    """Copia al índice local todos los vectores de un namespace de Pinecone (para empezar a usar local o both)."""
+    local = get_local_index()
+    copied = 0
+    for ids in index.list(namespace=namespace):
+        ids = list(ids)
+        for start in range(0, len(ids), batch_size):
+            response = index.fetch(ids=ids[start:start + batch_size], namespace=namespace)
+            vectors = [
+                {"id": vector_id, "values": list(vector.values), "metadata": dict(vector.metadata or {})}
+                for vector_id, vector in response.vectors.items()
+            ]
+            local.upsert(vectors)
+            copied += len(vectors)
+    return copied